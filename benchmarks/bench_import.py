@@ -0,0 +1,349 @@
+"""End-to-end import benchmarks, against the local stand-in of jpdb.io.
+
+    python benchmarks/bench_import.py [--sizes 1000 10000 50000]
+        [--scenarios scrape api sync search] [--latency 0.02] [--throttle 0.01]
+        [--workers 4] [--rps 1000] [--json results.json]
+
+Scenarios:
+- scrape: `VLSearchThread` crawls a vocabulary list, then `VLGenerationThread`
+  loads every vocabulary page and adds the notes
+- api: `VLAPIGenerationThread` lists and looks up a deck with the JPDB API
+- sync: imports a deck with the API, edits a note, then syncs the deck twice.
+  The first sync, without a snapshot, must leave the notes as they are; the
+  second finds a stale hash for the edited note and updates it
+- search: the JPDB tab, `search_all_expressions_jpdb_url` then
+  `JPDB_Note.from_jpdb` on the first result, `--queries` times
+
+Notes are added to a fake in-memory collection (see fake_anki.py). Every stage
+reports its wall time, requests/sec, 429 responses, notes/sec, CPU time and
+peak RSS. The server runs in its own process, so its CPU is not counted.
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import List, Optional
+import urllib.request
+
+import fake_anki
+import jpdb_server
+import stubs
+from common import import_kuma
+
+stubs.install()
+fake_anki.install()
+import_kuma()
+
+from kuma import anki as kuma_anki
+from kuma import client, crawler, sync
+from kuma.anki import KumaAnki
+from kuma.jpdb import JPDB, JPDB_Note, search_all_expressions_jpdb_url
+from kuma.jpdb_api import JpdbAPI, VLAPIGenerationThread
+from kuma.pitch_dictionary import PITCH_DICTIONARY
+from kuma.widget import VLGenerationThread, VLSearchThread
+
+DECK_NAME = "Kuma Bench"
+SERVER_PATH = Path(__file__).resolve().parent.joinpath("jpdb_server.py")
+
+
+class Signal:
+    """Replaces a pyqtSignal of the threads, and remembers its last emit."""
+
+    def __init__(self):
+        self.args = None
+
+    def emit(self, *args):
+        self.args = args
+
+
+def connect_signals(thread, *names: str) -> None:
+    for name in names:
+        setattr(thread, name, Signal())
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:  # not linux, fall back on the peak of the process
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Stage:
+    """Measures a stage: wall and CPU time, server requests and peak RSS."""
+
+    def __init__(self, server_url: str, scenario: str, size: int, name: str):
+        self.server_url = server_url
+        self.result = {"scenario": scenario, "size": size, "stage": name}
+        self.notes = 0
+        self._stop = threading.Event()
+
+    def _sample_rss(self) -> None:
+        while not self._stop.wait(0.02):
+            self.peak_rss = max(self.peak_rss, rss_bytes())
+
+    def __enter__(self) -> "Stage":
+        server_stats(self.server_url, reset=True)
+        self.peak_rss = rss_bytes()
+        self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+        self._sampler.start()
+        self._cpu = cpu_seconds()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        wall = time.perf_counter() - self._start
+        cpu = cpu_seconds() - self._cpu
+        self._stop.set()
+        self._sampler.join()
+        stats = server_stats(self.server_url)
+
+        self.result.update(
+            {
+                "wall_s": wall,
+                "requests": stats["requests"],
+                "requests_per_s": stats["requests"] / wall,
+                "throttled": stats["throttled"],
+                "mb_received": stats["bytes"] / 1024**2,
+                "notes": self.notes,
+                "notes_per_s": self.notes / wall,
+                "cpu_s": cpu,
+                "cpu_percent": 100 * cpu / wall,
+                "peak_rss_mb": max(self.peak_rss, rss_bytes()) / 1024**2,
+            }
+        )
+
+
+def server_stats(server_url: str, reset: bool = False) -> dict:
+    url = server_url + "/_stats" + ("?reset=1" if reset else "")
+    with urllib.request.urlopen(url) as response:
+        return json.load(response)
+
+
+def start_server(args) -> tuple:
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            str(SERVER_PATH),
+            "--port=0",
+            f"--latency={args.latency}",
+            f"--throttle={args.throttle}",
+            f"--retry-after={args.retry_after}",
+            f"--page-kb={args.page_kb}",
+        ]
+        + (["--recorded"] if args.recorded else []),
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    line = process.stdout.readline()
+    if not line.startswith("Serving on"):
+        process.kill()
+        raise RuntimeError("the stand-in server did not start")
+    return process, line.split()[-1]
+
+
+def setup(server_url: str, tmp_path: Path, max_size: int) -> None:
+    """Points the add-on to the stand-in server and to temporary files."""
+    JPDB.base_url = server_url
+    client.configure(cache=False)
+    crawler.CACHE_PATH = tmp_path.joinpath("vocab_lists")
+    kuma_anki.ORDERINGS_PATH = tmp_path.joinpath("reposition")
+    sync.SYNC_PATH = tmp_path.joinpath("sync")
+
+    # the pitch dictionary is not shipped with the sources
+    pitch_path = tmp_path.joinpath("pitch_dictionary.json")
+    with pitch_path.open("w") as f:
+        json.dump(jpdb_server.pitch_dictionary(max_size), f)
+    PITCH_DICTIONARY.close()
+    PITCH_DICTIONARY.json_path = pitch_path
+    PITCH_DICTIONARY.index_path = tmp_path.joinpath("pitch_dictionary.sqlite")
+
+
+def new_collection() -> fake_anki.FakeCollection:
+    col = fake_anki.FakeCollection([DECK_NAME])
+    KumaAnki.window = fake_anki.FakeMainWindow(col)
+    return col
+
+
+def count_notes(col: fake_anki.FakeCollection) -> int:
+    return col.db.scalar("select count() from notes")
+
+
+def run_scrape(server_url: str, size: int, config: dict) -> List[dict]:
+    col = new_collection()
+
+    url = f"{server_url}/novel/{size}/bench-{size}/vocabulary-list"
+    search = VLSearchThread(url, config)
+    connect_signals(search, "finished", "failed", "next_page")
+    with Stage(server_url, "scrape", size, "search") as search_stage:
+        search.run()
+    if search.failed.args is not None:
+        raise RuntimeError(search.failed.args[0])
+    (urls,) = search.finished.args
+
+    generation = VLGenerationThread(DECK_NAME, urls, config)
+    connect_signals(generation, "finished", "generated")
+    with Stage(server_url, "scrape", size, "generate") as generate_stage:
+        generation.run()
+        generate_stage.notes = count_notes(col)
+
+    return [search_stage.result, generate_stage.result]
+
+
+def run_api(server_url: str, size: int, config: dict) -> List[dict]:
+    col = new_collection()
+
+    api = JpdbAPI("bench", max_workers=config["workers"])
+    thread = VLAPIGenerationThread(api, size, DECK_NAME)
+    connect_signals(thread, "finished", "started_generation", "generated", "throughput")
+    with Stage(server_url, "api", size, "generate") as stage:
+        thread.run()
+        stage.notes = count_notes(col)
+    if thread.error is not None:
+        raise RuntimeError(thread.error)
+
+    # busy throughput of each stage of the pipeline
+    if thread.throughput.args is not None:
+        stage.result["pipeline"] = thread.throughput.args[0]
+    return [stage.result]
+
+
+def run_sync(server_url: str, size: int, config: dict) -> List[dict]:
+    col = new_collection()
+    api = JpdbAPI("bench", max_workers=config["workers"])
+
+    def run(name: str, **kwargs) -> Stage:
+        thread = VLAPIGenerationThread(api, size, DECK_NAME, **kwargs)
+        connect_signals(
+            thread, "finished", "started_generation", "generated", "throughput"
+        )
+        with Stage(server_url, "sync", size, name) as stage:
+            thread.run()
+            stage.notes = thread.n_updated
+        if thread.error is not None:
+            raise RuntimeError(thread.error)
+        return stage
+
+    def fields(nid: int) -> List[str]:
+        return col.db.scalar("select flds from notes where id = ?", nid).split("\x1f")
+
+    stages = [run("import")]
+    nid = col.db.scalar("select min(id) from notes")
+    note_id = col.get_note(nid)["ID"]
+    edited = fields(nid)
+    edited[5] = "edited in Anki"  # Meanings
+    col.db.execute("update notes set flds = ? where id = ?", "\x1f".join(edited), nid)
+
+    stages.append(run("first sync", sync=True))
+    if stages[-1].notes != 0 or fields(nid)[5] != "edited in Anki":
+        raise RuntimeError("the first sync updated notes already in the deck")
+
+    # as if the meanings of the note changed on JPDB since the last sync
+    snapshot = sync.Snapshot(KumaAnki.deck(DECK_NAME)["id"], f"api-{size}").load()
+    snapshot.save({**snapshot.hashes, note_id: "stale"})
+    stages.append(run("second sync", sync=True))
+    if stages[-1].notes != 1 or fields(nid)[5] == "edited in Anki":
+        raise RuntimeError("the second sync did not update the changed note")
+
+    return [stage.result for stage in stages]
+
+
+def run_search(server_url: str, size: int, config: dict) -> List[dict]:
+    col = new_collection()
+
+    queries = [jpdb_server.word(i)["spelling"] for i in range(size)]
+    with Stage(server_url, "search", size, "search + note") as stage:
+        notes = []
+        for query in queries:
+            entries = search_all_expressions_jpdb_url(query)
+            if len(entries) > 0:
+                notes.append(JPDB_Note.from_jpdb(JPDB.base_url + entries[0]))
+        KumaAnki.add_notes(notes, DECK_NAME)
+        stage.notes = count_notes(col)
+    return [stage.result]
+
+
+SCENARIOS = {
+    "scrape": run_scrape,
+    "api": run_api,
+    "sync": run_sync,
+    "search": run_search,
+}
+
+
+def report(result: dict) -> None:
+    print(
+        f"{result['scenario']:>7} {result['size']:>6} {result['stage']:>13}: "
+        f"{result['wall_s']:8.2f}s "
+        f"{result['requests']:>6} req ({result['requests_per_s']:7.1f}/s, "
+        f"{result['throttled']} x 429) "
+        f"{result['notes']:>6} notes ({result['notes_per_s']:7.1f}/s) "
+        f"cpu {result['cpu_s']:6.2f}s ({result['cpu_percent']:3.0f}%) "
+        f"rss {result['peak_rss_mb']:6.1f} MB"
+    )
+    if "pipeline" in result:
+        print(f"{'':>30}{result['pipeline']}")
+
+
+def main(argv: Optional[List[str]] = None):
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument(
+        "--sizes", nargs="+", type=int, default=[1000, 10000, 50000]
+    )
+    arg_parser.add_argument(
+        "--scenarios", nargs="+", choices=SCENARIOS, default=["scrape", "api"]
+    )
+    arg_parser.add_argument("--queries", type=int, default=100)
+    arg_parser.add_argument("--latency", type=float, default=0.0)
+    arg_parser.add_argument("--throttle", type=float, default=0.0)
+    arg_parser.add_argument("--retry-after", type=int, default=1)
+    arg_parser.add_argument("--page-kb", type=int, default=64)
+    arg_parser.add_argument("--recorded", action="store_true")
+    arg_parser.add_argument("--workers", type=int, default=4)
+    arg_parser.add_argument("--rps", type=float, default=1000.0)
+    arg_parser.add_argument("--json", type=Path)
+    args = arg_parser.parse_args(argv)
+
+    # same keys as config/vl.json
+    config = {
+        "sleep_time": 0.0,
+        "requests_per_second": args.rps,
+        "burst": args.workers,
+        "workers": args.workers,
+    }
+
+    process, server_url = start_server(args)
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            setup(server_url, Path(tmp), max(args.sizes))
+            for scenario in args.scenarios:
+                sizes = [args.queries] if scenario == "search" else args.sizes
+                for size in sizes:
+                    for result in SCENARIOS[scenario](server_url, size, config):
+                        report(result)
+                        results.append(result)
+            PITCH_DICTIONARY.close()
+    finally:
+        process.terminate()
+        process.wait()
+
+    if args.json is not None:
+        with args.json.open("w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
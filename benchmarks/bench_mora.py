@@ -0,0 +1,76 @@
+"""Segments every reading of the pitch dictionary into morae.
+
+    python benchmarks/bench_mora.py [--baseline REV]
+
+Reports readings/sec for the regex segmentation, cold and cached, and
+optionally for `hira_to_mora` as it was at the git revision REV. Readings
+with small ゎ/ヮ are segmented differently on purpose; any other difference
+with the baseline fails.
+"""
+
+import argparse
+import sys
+
+from common import (
+    has_changed_morae,
+    import_kuma,
+    load_module_at,
+    load_pitch_dictionary,
+    timeit,
+)
+
+import_kuma()
+
+from kuma import mora
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--baseline", metavar="REV")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    dictionary = load_pitch_dictionary()
+    readings = [r for readings in dictionary.values() for r in readings]
+    print(f"{len(readings)} readings, {len(set(readings))} distinct")
+
+    def report(name, elapsed):
+        print(f"{name:>10}: {len(readings) / elapsed:10.0f} readings/sec")
+
+    if args.baseline:
+        baseline = load_module_at(args.baseline, "kuma/pitch.py", "baseline_pitch")
+        differences = [
+            r for r in readings if baseline.hira_to_mora(r) != list(mora.to_mora(r))
+        ]
+        unexpected = [r for r in differences if not has_changed_morae(r)]
+        print(
+            f"{len(differences) - len(unexpected)} readings segmented differently "
+            "as declared (small ゎ/ヮ)"
+        )
+        if len(unexpected) > 0:
+            print(f"{len(unexpected)} readings segmented differently, e.g.:")
+            for r in unexpected[:5]:
+                print("   ", r, baseline.hira_to_mora(r), mora.to_mora(r))
+            sys.exit(1)
+
+        def run_baseline():
+            for r in readings:
+                baseline.hira_to_mora(r)
+
+        report("baseline", timeit(run_baseline, repeat=args.repeat))
+
+    def run_split():
+        for r in readings:
+            mora.split_mora(r)
+
+    def run_cached():
+        for r in readings:
+            mora.to_mora(r)
+
+    report("regex", timeit(run_split, repeat=args.repeat))
+    report("cached", timeit(run_cached, repeat=args.repeat))
+    print(mora.to_mora.cache_info())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Compares the HTML parser backends on saved vocabulary pages.
+
+Save pages once with:
+    python benchmarks/bench_parser.py --save https://jpdb.io/vocabulary/...
+then run:
+    python benchmarks/bench_parser.py [--check]
+
+With --check, the notes extracted by every backend are compared field by
+field, without timing, and the exit status is 1 if any of them differ.
+The fixtures are pages with the markup of jpdb.io vocabulary pages; their
+pitches come from `fixtures/pitch_dictionary.json`.
+"""
+
+import argparse
+from dataclasses import asdict
+import sys
+import tempfile
+from pathlib import Path
+
+from bs4 import FeatureNotFound
+
+from common import FIXTURES_PATH, import_kuma, timeit
+
+import_kuma()
+
+from kuma import client
+from kuma.jpdb import JPDB_Note, extract_id, parse_html
+from kuma.pitch_dictionary import PITCH_DICTIONARY
+
+VOCABULARY_PATH = FIXTURES_PATH.joinpath("vocabulary")
+PITCH_DICTIONARY_PATH = FIXTURES_PATH.joinpath("pitch_dictionary.json")
+BACKENDS = ["html.parser", "lxml"]
+
+
+def save_fixtures(urls):
+    VOCABULARY_PATH.mkdir(parents=True, exist_ok=True)
+    for url in urls:
+        path = VOCABULARY_PATH.joinpath(extract_id(url) + ".html")
+        path.write_bytes(client.get(url).content)
+        print("saved", path)
+
+
+def load_fixtures():
+    return [
+        ("https://jpdb.io/vocabulary/" + p.stem + "/fixture", p.read_bytes())
+        for p in sorted(VOCABULARY_PATH.glob("*.html"))
+    ]
+
+
+def parse_all(pages, parser):
+    return [JPDB_Note.from_soup(parse_html(html, parser), url) for url, html in pages]
+
+
+def use_fixture_dictionary(tmp_path: Path) -> None:
+    PITCH_DICTIONARY.close()
+    PITCH_DICTIONARY.json_path = PITCH_DICTIONARY_PATH
+    PITCH_DICTIONARY.index_path = tmp_path.joinpath("pitch_dictionary.sqlite")
+
+
+def check(pages) -> int:
+    """Compares the notes of every backend to the ones of html.parser."""
+    reference = [asdict(n) for n in parse_all(pages, BACKENDS[0])]
+    n_differences = 0
+    for parser in BACKENDS[1:]:
+        try:
+            notes = [asdict(n) for n in parse_all(pages, parser)]
+        except FeatureNotFound:
+            print(f"{parser:>12}: not installed, not compared")
+            continue
+
+        for (url, _), expected, note in zip(pages, reference, notes):
+            for key, value in expected.items():
+                if note[key] != value:
+                    n_differences += 1
+                    print(f"{parser}: {url} {key}: {note[key]!r} != {value!r}")
+        print(f"{parser:>12}: {len(pages)} pages compared")
+
+    if n_differences > 0:
+        print(n_differences, "differences")
+        return 1
+    print("identical extraction")
+    return 0
+
+
+def compare(pages, repeat: int) -> None:
+    reference = None
+    for parser in BACKENDS:
+        try:
+            notes = [asdict(n) for n in parse_all(pages, parser)]
+        except FeatureNotFound as e:
+            print(f"{parser:>12}: unavailable ({e})")
+            continue
+
+        if reference is None:
+            reference = notes
+        same = "identical" if notes == reference else "DIFFERENT output"
+
+        elapsed = timeit(parse_all, pages, parser, repeat=repeat)
+        print(
+            f"{parser:>12}: {len(pages) / elapsed:8.1f} pages/sec "
+            f"({1000 * elapsed / len(pages):.2f} ms/page, {same})"
+        )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--save", nargs="+", metavar="URL")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--check", action="store_true")
+    args = arg_parser.parse_args()
+
+    if args.save:
+        save_fixtures(args.save)
+        return
+
+    pages = load_fixtures()
+    if len(pages) == 0:
+        print("No fixture in", VOCABULARY_PATH, "- save some pages with --save.")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        use_fixture_dictionary(Path(tmp))
+        try:
+            if args.check:
+                sys.exit(check(pages))
+            compare(pages, args.repeat)
+        finally:
+            PITCH_DICTIONARY.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Renders the pitch of every entry of the pitch dictionary.
+
+    python benchmarks/bench_pitch.py [--baseline REV]
+
+Reports renders/sec with a cold and a warm render cache, and optionally for
+`kuma/pitch.py` as it was at the git revision REV. The renders must then be
+the same, except for the readings with small ゎ/ヮ, whose segmentation was
+deliberately changed.
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+
+from common import (
+    has_changed_morae,
+    import_kuma,
+    load_module_at,
+    load_pitch_dictionary,
+    timeit,
+)
+
+import_kuma()
+
+from kuma import pitch
+
+# silences the warnings about the entries with inconsistent patterns
+logging.getLogger(pitch.__name__).setLevel(logging.ERROR)
+
+
+def render_all(module, dictionary):
+    # the baseline revisions print their warnings
+    with contextlib.redirect_stdout(io.StringIO()):
+        return [
+            module.get_pitch_html(expression, reading, dictionary)
+            for expression, readings in dictionary.items()
+            for reading in readings
+        ]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--baseline", metavar="REV")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    dictionary = load_pitch_dictionary()
+    n_entries = sum(len(readings) for readings in dictionary.values())
+    print(f"{n_entries} entries")
+
+    def report(name, elapsed):
+        print(f"{name:>10}: {n_entries / elapsed:10.0f} renders/sec")
+
+    if args.baseline:
+        baseline = load_module_at(args.baseline, "kuma/pitch.py", "baseline_pitch")
+        comparable = {
+            expression: {r: p for r, p in readings.items() if not has_changed_morae(r)}
+            for expression, readings in dictionary.items()
+        }
+        n_skipped = n_entries - sum(len(r) for r in comparable.values())
+        print(f"{n_skipped} entries with small ゎ/ヮ not compared to the baseline")
+        assert render_all(baseline, comparable) == render_all(pitch, comparable)
+        report("baseline", timeit(render_all, baseline, dictionary, repeat=args.repeat))
+
+    def cold():
+        pitch.configure_svg_cache(pitch.SVG_CACHE_SIZE)
+        render_all(pitch, dictionary)
+
+    report("cold", timeit(cold, repeat=args.repeat))
+    report("warm", timeit(render_all, pitch, dictionary, repeat=args.repeat))
+    print(pitch.svg_cache_info())
+
+
+if __name__ == "__main__":
+    main()
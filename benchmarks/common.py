@@ -0,0 +1,67 @@
+"""Helpers shared by the benchmarks.
+
+The benchmarks run outside of Anki: `kuma` is imported as a bare package,
+without running its `__init__` (which registers the add-on in Anki).
+"""
+
+import importlib.machinery
+import importlib.util
+import json
+from pathlib import Path
+import subprocess
+import sys
+import time
+import types
+
+ROOT_PATH = Path(__file__).resolve().parent.parent
+KUMA_PATH = ROOT_PATH.joinpath("kuma")
+FIXTURES_PATH = Path(__file__).resolve().parent.joinpath("fixtures")
+
+
+def import_kuma() -> None:
+    """Registers `kuma` in sys.modules without executing its __init__."""
+    if "kuma" in sys.modules:
+        return
+    spec = importlib.machinery.ModuleSpec("kuma", None, is_package=True)
+    spec.submodule_search_locations = [str(KUMA_PATH)]
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["kuma"] = module
+
+
+def timeit(fn, *args, repeat: int = 3) -> float:
+    """Returns the best wall time of `repeat` runs, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def load_module_at(revision: str, path: str, name: str):
+    """Imports a module as it was at a git revision, e.g. to compare timings."""
+    source = subprocess.run(
+        ["git", "show", f"{revision}:{path}"],
+        cwd=ROOT_PATH,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    module = types.ModuleType(name)
+    exec(compile(source, f"{revision}:{path}", "exec"), module.__dict__)
+    return module
+
+
+# small ゎ/ヮ are combined with the kana before them since kuma/mora.py, so
+# their readings are segmented, and rendered, differently by older revisions
+CHANGED_COMBINERS = "ゎヮ"
+
+
+def has_changed_morae(reading: str) -> bool:
+    """Whether a reading is affected by the declared change of segmentation."""
+    return any(c in reading for c in CHANGED_COMBINERS)
+
+
+def load_pitch_dictionary(path: Path = KUMA_PATH.joinpath("pitch_dictionary.json")):
+    with path.open("r") as f:
+        return json.load(f)
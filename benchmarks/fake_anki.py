@@ -0,0 +1,381 @@
+"""Headless fake of the Anki collection used by `KumaAnki`.
+
+Notes and cards are stored in an in-memory sqlite database with the columns
+of Anki's schema, so that the raw queries of the add-on run unchanged. Only
+the searches used by the add-on are supported: `deck:`, `note:` and `nid:`.
+
+    import stubs, fake_anki
+    stubs.install()
+    fake_anki.install()  # before importing kuma.anki
+    ...
+    KumaAnki.window = fake_anki.FakeMainWindow()
+"""
+
+import itertools
+import re
+import sqlite3
+import sys
+import threading
+import time
+from types import SimpleNamespace
+from typing import List, Optional
+
+SCHEMA = [
+    "create table notes (id integer primary key, guid text not null, "
+    "mid integer not null, mod integer not null, usn integer not null, "
+    "tags text not null, flds text not null, sfld text not null, "
+    "csum integer not null, flags integer not null, data text not null)",
+    "create table cards (id integer primary key, nid integer not null, "
+    "did integer not null, ord integer not null, mod integer not null, "
+    "usn integer not null, type integer not null, queue integer not null, "
+    "due integer not null, ivl integer not null, factor integer not null, "
+    "reps integer not null, lapses integer not null, left integer not null, "
+    "odue integer not null, odid integer not null, flags integer not null, "
+    "data text not null)",
+    "create index ix_cards_nid on cards (nid)",
+    "create index ix_cards_did on cards (did)",
+]
+
+_TERM_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def ids2str(ids) -> str:
+    return "(" + ",".join(str(i) for i in ids) + ")"
+
+
+class FakeDB:
+    """The `col.db` proxy: rows are returned as lists, like in Anki."""
+
+    def __init__(self):
+        self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        self._lock = threading.RLock()
+        for statement in SCHEMA:
+            self._db.execute(statement)
+
+    def execute(self, sql: str, *args) -> List[list]:
+        with self._lock:
+            return [list(row) for row in self._db.execute(sql, args)]
+
+    def executemany(self, sql: str, args) -> None:
+        with self._lock:
+            self._db.executemany(sql, args)
+
+    def all(self, sql: str, *args) -> List[list]:
+        return self.execute(sql, *args)
+
+    def list(self, sql: str, *args) -> list:
+        return [row[0] for row in self.execute(sql, *args)]
+
+    def first(self, sql: str, *args) -> Optional[list]:
+        rows = self.execute(sql, *args)
+        return rows[0] if rows else None
+
+    def scalar(self, sql: str, *args):
+        row = self.first(sql, *args)
+        return row[0] if row else None
+
+
+class FakeModels:
+    def __init__(self):
+        self._models = {}
+        self._ids = itertools.count(1)
+
+    def by_name(self, name: str) -> Optional[dict]:
+        return self._models.get(name)
+
+    def get(self, mid: int) -> Optional[dict]:
+        return next((m for m in self._models.values() if m["id"] == mid), None)
+
+    def all_names_and_ids(self) -> list:
+        return [
+            SimpleNamespace(name=m["name"], id=m["id"]) for m in self._models.values()
+        ]
+
+    def new(self, name: str) -> dict:
+        return {"id": 0, "name": name, "flds": [], "tmpls": [], "css": "", "did": None}
+
+    def new_field(self, name: str) -> dict:
+        return {"name": name}
+
+    def add_field(self, model: dict, field: dict) -> None:
+        field["ord"] = len(model["flds"])
+        model["flds"].append(field)
+
+    def new_template(self, name: str) -> dict:
+        return {"name": name}
+
+    def add_template(self, model: dict, template: dict) -> None:
+        template["ord"] = len(model["tmpls"])
+        model["tmpls"].append(template)
+
+    def add(self, model: dict) -> None:
+        model["id"] = next(self._ids)
+        self._models[model["name"]] = model
+
+    def field_map(self, model: dict) -> dict:
+        return {f["name"]: (f["ord"], f) for f in model["flds"]}
+
+
+class FakeDecks:
+    def __init__(self, names: List[str]):
+        self._decks = {}
+        self._ids = itertools.count(1)
+        for name in names:
+            self.id(name)
+
+    def id(self, name: str) -> int:
+        if name not in self._decks:
+            self._decks[name] = {"id": next(self._ids), "name": name}
+        return self._decks[name]["id"]
+
+    def by_name(self, name: str) -> Optional[dict]:
+        return self._decks.get(name)
+
+    def all_names(self, force_default: bool = True) -> List[str]:
+        return list(self._decks)
+
+
+class FakeNote:
+    """`anki.notes.Note`, reduced to what the add-on uses."""
+
+    def __init__(
+        self, col: "FakeCollection", model: Optional[dict] = None, id: int = 0
+    ):
+        self.col = col
+        self.id = id
+        self.guid = ""
+        self.mod = 0
+        self.usn = 0
+        self.tags: List[str] = []
+        if id:
+            self.load()
+        else:
+            self.mid = model["id"]
+            self.fields = [""] * len(model["flds"])
+
+    def load(self) -> None:
+        guid, mid, mod, usn, tags, flds = self.col.db.first(
+            "select guid, mid, mod, usn, tags, flds from notes where id = ?", self.id
+        )
+        self.guid, self.mid, self.mod, self.usn = guid, mid, mod, usn
+        self.tags = tags.split()
+        self.fields = flds.split("\x1f")
+
+    def note_type(self) -> dict:
+        return self.col.models.get(self.mid)
+
+    def _index(self, key: str) -> int:
+        return self.col.models.field_map(self.note_type())[key][0]
+
+    def __getitem__(self, key: str) -> str:
+        return self.fields[self._index(key)]
+
+    def __setitem__(self, key: str, value: str) -> None:
+        self.fields[self._index(key)] = value
+
+    def keys(self) -> List[str]:
+        return [f["name"] for f in self.note_type()["flds"]]
+
+    def joined_fields(self) -> str:
+        return "\x1f".join(self.fields)
+
+
+class FakeScheduler:
+    """`anki.scheduler.Scheduler`, reduced to what the add-on uses."""
+
+    def __init__(self, col: "FakeCollection"):
+        self.col = col
+        self.calls = 0
+
+    def reposition_new_cards(
+        self,
+        card_ids: List[int],
+        starting_from: int,
+        step_size: int,
+        randomize: bool,
+        shift_existing: bool,
+    ) -> "OpChangesWithCount":
+        # like Anki without `randomize`: the notes are numbered in the order
+        # of the current due of their cards, cards of a note share a position
+        self.calls += 1
+        rows = self.col.db.all(
+            f"select id, nid, due from cards where type = 0 and id in {ids2str(card_ids)}"
+        )
+        rows.sort(key=lambda row: row[2])
+        position = {}
+        for _, nid, _ in rows:
+            position.setdefault(nid, starting_from + step_size * len(position))
+        self.col.db.executemany(
+            "update cards set mod = ?, usn = ?, due = ? where id = ?",
+            [(int(time.time()), -1, position[nid], cid) for cid, nid, _ in rows],
+        )
+        return OpChangesWithCount(OpChanges(), len(rows))
+
+
+class OpChanges:
+    pass
+
+
+class OpChangesWithCount:
+    def __init__(self, changes: Optional[OpChanges] = None, count: int = 0):
+        self.changes = changes
+        self.count = count
+
+
+class AddNoteRequest:
+    def __init__(self, note: FakeNote, deck_id: int):
+        self.note = note
+        self.deck_id = deck_id
+
+
+class FakeCollection:
+    """The subset of `anki.collection.Collection` used by the add-on."""
+
+    def __init__(self, decks: List[str] = ["Default"]):
+        self.db = FakeDB()
+        self.models = FakeModels()
+        self.decks = FakeDecks(decks)
+        self.sched = FakeScheduler(self)
+
+        self._ids = itertools.count(int(time.time() * 1000))
+        self._due = itertools.count(1)
+        self._undo = itertools.count(1)
+
+    def usn(self) -> int:
+        return -1
+
+    def add_custom_undo_entry(self, name: str) -> int:
+        return next(self._undo)
+
+    def merge_undo_entries(self, target: int) -> OpChanges:
+        return OpChanges()
+
+    def get_note(self, nid: int) -> FakeNote:
+        return FakeNote(self, id=nid)
+
+    def add_note(self, note: FakeNote, deck_id: int) -> None:
+        self.add_notes([AddNoteRequest(note, deck_id)])
+
+    def add_notes(self, requests: List[AddNoteRequest]) -> None:
+        now = int(time.time())
+        notes, cards = [], []
+        for request in requests:
+            note = request.note
+            note.id, note.mod, note.usn = next(self._ids), now, -1
+            note.guid = f"g{note.id}"
+            notes.append(
+                (
+                    note.id,
+                    note.guid,
+                    note.mid,
+                    now,
+                    -1,
+                    " ".join(note.tags),
+                    note.joined_fields(),
+                    note.fields[0],
+                    0,
+                    0,
+                    "",
+                )
+            )
+            due = next(self._due)
+            for template in note.note_type()["tmpls"]:
+                cards.append(
+                    (
+                        next(self._ids),
+                        note.id,
+                        request.deck_id,
+                        template["ord"],
+                        now,
+                        -1,
+                        0,
+                        0,
+                        due,
+                        0,
+                        0,
+                        0,
+                        0,
+                        0,
+                        0,
+                        0,
+                        0,
+                        "",
+                    )
+                )
+        self.db.executemany(
+            "insert into notes values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", notes
+        )
+        self.db.executemany(
+            "insert into cards values "
+            "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            cards,
+        )
+
+    def update_note(self, note: FakeNote) -> None:
+        self.update_notes([note])
+
+    def update_notes(self, notes: List[FakeNote]) -> None:
+        now = int(time.time())
+        self.db.executemany(
+            "update notes set mod = ?, usn = ?, tags = ?, flds = ?, sfld = ? "
+            "where id = ?",
+            [
+                (now, -1, " ".join(n.tags), n.joined_fields(), n.fields[0], n.id)
+                for n in notes
+            ],
+        )
+
+    def remove_notes(self, nids: List[int]) -> None:
+        self.db.execute(f"delete from cards where nid in {ids2str(nids)}")
+        self.db.execute(f"delete from notes where id in {ids2str(nids)}")
+
+    def _where(self, query: str) -> tuple:
+        clauses, args = [], []
+        for quoted, bare in _TERM_PATTERN.findall(query):
+            key, _, value = (quoted or bare).partition(":")
+            if key == "deck":
+                deck = self.decks.by_name(value)
+                clauses.append("c.did = ?")
+                args.append(deck["id"] if deck else -1)
+            elif key == "note":
+                model = self.models.by_name(value)
+                clauses.append("n.mid = ?")
+                args.append(model["id"] if model else -1)
+            elif key == "nid":
+                clauses.append(f"n.id in {ids2str(map(int, value.split(',')))}")
+            else:
+                raise ValueError(f"unsupported search term: {quoted or bare}")
+        return " and ".join(clauses) or "1", args
+
+    def find_notes(self, query: str) -> List[int]:
+        where, args = self._where(query)
+        return self.db.list(
+            "select distinct n.id from notes n join cards c on c.nid = n.id "
+            f"where {where} order by n.id",
+            *args,
+        )
+
+    def find_cards(self, query: str) -> List[int]:
+        where, args = self._where(query)
+        return self.db.list(
+            "select c.id from cards c join notes n on c.nid = n.id "
+            f"where {where} order by c.id",
+            *args,
+        )
+
+
+class FakeMainWindow:
+    """Stands for `aqt.mw`, the only way the add-on reaches the collection."""
+
+    def __init__(self, col: Optional[FakeCollection] = None):
+        self.col = col if col is not None else FakeCollection()
+
+
+def install() -> None:
+    """Replaces the note classes of the stub `anki` modules by the fakes."""
+    sys.modules["anki.notes"].Note = FakeNote
+    sys.modules["anki.collection"].AddNoteRequest = AddNoteRequest
+    sys.modules["anki.collection"].Collection = FakeCollection
+    sys.modules["anki.collection"].OpChanges = OpChanges
+    sys.modules["anki.collection"].OpChangesWithCount = OpChangesWithCount
+    sys.modules["anki.utils"].ids2str = ids2str
@@ -0,0 +1,348 @@
+"""Local stand-in for jpdb.io, to benchmark the add-on without the network.
+
+    python benchmarks/jpdb_server.py [--port 8000] [--latency 0.05]
+        [--throttle 0.01] [--retry-after 1] [--recorded]
+
+Serves a deterministic vocabulary of synthetic words:
+- `/search?q=...`: search results, the words whose expression contains q
+- `/vocabulary/<vid>/<expression>`: vocabulary pages, either synthetic or,
+  with --recorded, the pages saved by `bench_parser.py --save`
+- `/<kind>/<n>/<name>/vocabulary-list?offset=...`: a vocabulary list of the
+  first n words, 50 per page
+- `/api/v1/deck/list-vocabulary`: the first `id` words
+- `/api/v1/lookup-vocabulary`
+- `/_stats`: counters of the served requests, reset with `?reset=1`
+
+Every request waits `--latency` seconds, and `--throttle` is the probability
+of answering 429 Too Many Requests instead.
+"""
+
+import argparse
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import random
+import threading
+import time
+from typing import List, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from common import FIXTURES_PATH
+
+PAGE_SIZE = 50
+FIRST_VID = 1_000_000
+
+KANA = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわん"
+KANJI = "日国人年大本中長出時事自行社見分後前生発間上部者地合市業内方定新場金"
+OKURIGANA = ["", "", "る", "い", "す", "く", "む", "う"]
+PARTS_OF_SPEECH = [["n"], ["v1", "vt"], ["adj-i"], ["adv"], ["n", "vs"], ["exp"]]
+
+
+@lru_cache(maxsize=None)
+def word(i: int) -> dict:
+    """Returns the i-th word of the synthetic vocabulary."""
+    rng = random.Random(i)
+    reading = "".join(rng.choice(KANA) for _ in range(rng.randint(2, 5)))
+    if rng.random() < 0.7:
+        kanji = "".join(rng.choice(KANJI) for _ in range(rng.randint(1, 2)))
+        okurigana = rng.choice(OKURIGANA)
+        expression, reading = kanji + okurigana, reading + okurigana
+    else:
+        expression = reading
+    return {
+        "vid": FIRST_VID + i,
+        "sid": i,
+        "spelling": expression,
+        "reading": reading,
+        "pitch": rng.randint(0, len(reading)),
+        "frequency_rank": (i * 7919) % 100_000 + 1,
+        "meanings": [f"meaning {k} of word {i}" for k in range(rng.randint(1, 4))],
+        "part_of_speech": rng.choice(PARTS_OF_SPEECH),
+    }
+
+
+def index_of(vid: int) -> int:
+    return vid - FIRST_VID
+
+
+def pitch_dictionary(n_words: int) -> dict:
+    """Returns the pitch dictionary of the first `n_words` words."""
+    dictionary = {}
+    for i in range(n_words):
+        w = word(i)
+        dictionary.setdefault(w["spelling"], {})[w["reading"]] = w["pitch"]
+    return dictionary
+
+
+def page(title: str, body: str, head: str = "") -> bytes:
+    return (
+        f"<!DOCTYPE html><html><head><title>{title}</title>{head}</head>"
+        f"<body>{body}</body></html>"
+    ).encode()
+
+
+def filler(size: int) -> str:
+    """Markup the parser has to go through, like the menus of the real site."""
+    item = '<div class="nav-item"><a href="/about">About jpdb</a></div>'
+    return '<nav class="menu">' + item * (size // len(item)) + "</nav>"
+
+
+def entry_href(w: dict) -> str:
+    return f"/vocabulary/{w['vid']}/{w['spelling']}#a"
+
+
+def vocabulary_page(w: dict, padding: int) -> bytes:
+    meanings = "".join(f'<div class="description">{m}</div>' for m in w["meanings"])
+    part_of_speech = "".join(f"<div>{pos}</div>" for pos in w["part_of_speech"])
+    examples = (
+        '<div class="used-in">'
+        f'<div class="jp">{w["spelling"]}を使う。</div>'
+        f'<div class="en">An example with word {w["sid"]}.</div>'
+        "</div>"
+    )
+    head = (
+        '<meta name="description" content="'
+        f'{w["spelling"]} - Japanese meaning: ({w["reading"]}) {w["meanings"][0]}">'
+    )
+    body = (
+        filler(padding)
+        + f'<div class="part-of-speech">{part_of_speech}</div>'
+        + '<div class="primary-spelling"><div class="spelling">'
+        + f'<ruby>{w["spelling"]}<rt>{w["reading"]}</rt></ruby></div></div>'
+        + f'<div class="tag tooltip">Top {w["frequency_rank"]}</div>'
+        + f'<div class="subsection-meanings">{meanings}</div>'
+        + f'<div class="subsection-examples">{examples}</div>'
+    )
+    return page(f"{w['spelling']} – Meaning in Japanese", body, head)
+
+
+def vocabulary_list_page(n_words: int, offset: int) -> bytes:
+    entries = "".join(
+        '<div class="entry"><div class="vocabulary-spelling">'
+        f'<a href="{entry_href(word(i))}">{word(i)["spelling"]}</a></div></div>'
+        for i in range(offset, min(offset + PAGE_SIZE, n_words))
+    )
+    if offset + PAGE_SIZE < n_words:
+        pagination = (
+            f'<div class="pagination"><a href="?offset={offset + PAGE_SIZE}">'
+            "Next page</a></div>"
+        )
+    else:
+        pagination = '<div class="pagination without-next"></div>'
+    return page("Vocabulary list", entries + pagination)
+
+
+def search_page(query: str, n_words: int) -> bytes:
+    results = []
+    for i in range(n_words):
+        w = word(i)
+        if query in w["spelling"] or query in w["reading"]:
+            results.append(
+                f'<div id="result-{len(results)}">'
+                f'<a class="view-conjugations-link" href="{entry_href(w)}">'
+                f'{w["spelling"]}</a></div>'
+            )
+            if len(results) == PAGE_SIZE:
+                break
+    return page(f"{query} – Search", "".join(results))
+
+
+class JpdbStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple,
+        *,
+        latency: float = 0.0,
+        throttle: float = 0.0,
+        retry_after: int = 1,
+        padding: int = 64 * 1024,
+        search_words: int = 10_000,
+        recorded: Optional[List[bytes]] = None,
+    ):
+        super().__init__(address, Handler)
+        self.latency = latency
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.padding = padding
+        self.search_words = search_words
+        self.recorded = recorded
+
+        self.lock = threading.Lock()
+        self.rng = random.Random(0)
+        self.stats = {"requests": 0, "throttled": 0, "bytes": 0}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key: str, n: int = 1) -> None:
+        with self.lock:
+            self.stats[key] += n
+
+    def should_throttle(self) -> bool:
+        with self.lock:
+            return self.rng.random() < self.throttle
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keeps the connections of the pool alive
+    server: JpdbStandIn
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, status: int, body: bytes, content_type: str, **headers) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name.replace("_", "-"), value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count("bytes", len(body))
+
+    def send_html(self, body: bytes) -> None:
+        self.send(200, body, "text/html; charset=utf-8")
+
+    def send_json(self, data, status: int = 200) -> None:
+        self.send(status, json.dumps(data).encode(), "application/json")
+
+    def begin(self) -> bool:
+        """Counts the request, simulates latency and throttling."""
+        self.server.count("requests")
+        if self.server.latency > 0:
+            time.sleep(self.server.latency)
+        if self.server.should_throttle():
+            self.server.count("throttled")
+            self.send(
+                429,
+                b"Too Many Requests",
+                "text/plain",
+                Retry_After=str(self.server.retry_after),
+            )
+            return False
+        return True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        path = unquote(url.path).strip("/").split("/")
+        query = parse_qs(url.query)
+
+        if path == ["_stats"]:
+            with self.server.lock:
+                stats = dict(self.server.stats)
+                if "reset" in query:
+                    self.server.stats = dict.fromkeys(stats, 0)
+            return self.send_json(stats)
+
+        if not self.begin():
+            return
+
+        if path == ["search"]:
+            q = query.get("q", [""])[0]
+            return self.send_html(search_page(q, self.server.search_words))
+
+        if len(path) >= 2 and path[0] == "vocabulary" and path[1].isdigit():
+            i = index_of(int(path[1]))
+            if i < 0:
+                return self.send(404, b"Not Found", "text/plain")
+            if self.server.recorded:
+                recorded = self.server.recorded
+                return self.send_html(recorded[i % len(recorded)])
+            return self.send_html(vocabulary_page(word(i), self.server.padding))
+
+        if len(path) == 4 and path[3] == "vocabulary-list" and path[1].isdigit():
+            offset = int(query.get("offset", ["0"])[0])
+            return self.send_html(vocabulary_list_page(int(path[1]), offset))
+
+        self.send(404, b"Not Found", "text/plain")
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        if not self.begin():
+            return
+
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            return self.send_json({"error_message": "missing API key"}, 403)
+
+        if path == "/api/v1/deck/list-vocabulary":
+            n_words = payload.get("id", -1)
+            if not isinstance(n_words, int) or n_words < 0:
+                return self.send_json({"error_message": "bad deck id"}, 400)
+            return self.send_json(
+                {
+                    "vocabulary": [
+                        [word(i)["vid"], word(i)["sid"]] for i in range(n_words)
+                    ]
+                }
+            )
+
+        if path == "/api/v1/lookup-vocabulary":
+            fields = payload.get("fields", [])
+            return self.send_json(
+                {
+                    "vocabulary_info": [
+                        (
+                            [word(index_of(vid))[f] for f in fields]
+                            if index_of(vid) >= 0
+                            else None
+                        )
+                        for vid, _ in payload.get("list", [])
+                    ]
+                }
+            )
+
+        self.send_json({"error_message": "unknown endpoint"}, 404)
+
+
+def load_recorded() -> List[bytes]:
+    return [
+        p.read_bytes()
+        for p in sorted(FIXTURES_PATH.joinpath("vocabulary").glob("*.html"))
+    ]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8000)
+    arg_parser.add_argument("--latency", type=float, default=0.0)
+    arg_parser.add_argument("--throttle", type=float, default=0.0)
+    arg_parser.add_argument("--retry-after", type=int, default=1)
+    arg_parser.add_argument("--page-kb", type=int, default=64)
+    arg_parser.add_argument("--search-words", type=int, default=10_000)
+    arg_parser.add_argument("--recorded", action="store_true")
+    args = arg_parser.parse_args()
+
+    recorded = None
+    if args.recorded:
+        recorded = load_recorded()
+        if len(recorded) == 0:
+            arg_parser.error("no page saved, see bench_parser.py --save")
+
+    server = JpdbStandIn(
+        (args.host, args.port),
+        latency=args.latency,
+        throttle=args.throttle,
+        retry_after=args.retry_after,
+        padding=args.page_kb * 1024,
+        search_words=args.search_words,
+        recorded=recorded,
+    )
+    # the benchmarks read the url of the server from this line
+    print("Serving on", server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Reports the import cost of the add-on, against stub Anki modules.
+
+    python benchmarks/startup.py [--top N] [--max-ms MS]
+
+Measures what Anki pays at startup (`import kuma`, which registers the
+menu action) and on the first open of the Kuma Browser (`import
+kuma.addon`), with `python -X importtime`. With --max-ms, exits with an
+error when the startup import takes longer, to catch regressions.
+"""
+
+import argparse
+from pathlib import Path
+import subprocess
+import sys
+
+from common import ROOT_PATH
+
+SCENARIOS = {
+    "startup": "import kuma",
+    "first open": "import kuma; import kuma.addon",
+}
+
+
+def import_times(statement: str) -> list[tuple[int, int, str]]:
+    """Returns (self us, cumulative us, module) of every imported module."""
+    code = (
+        "import sys; "
+        f"sys.path.insert(0, {str(Path(__file__).resolve().parent)!r}); "
+        "import stubs; stubs.install(); "
+        "sys.stderr.write('-- start --\\n'); "
+        f"{statement}"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT_PATH,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    times = []
+    for line in result.stderr.split("-- start --\n")[-1].splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:") :].split("|")
+        times.append((int(self_us), int(cumulative_us), module[1:].rstrip()))
+    return times
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--top", type=int, default=15)
+    arg_parser.add_argument("--max-ms", type=float)
+    args = arg_parser.parse_args()
+
+    totals = {}
+    for name, statement in SCENARIOS.items():
+        try:
+            times = import_times(statement)
+        except RuntimeError as e:
+            print(f"== {name}: {statement!r} failed: {e}\n")
+            continue
+        # top level imports are not indented
+        total_us = sum(c for _, c, m in times if not m.startswith(" "))
+        totals[name] = total_us / 1000
+
+        print(f"== {name}: {statement!r} takes {totals[name]:.1f} ms")
+        print(f"{'self ms':>9} {'cumul. ms':>10}  module")
+        slowest = sorted(times, key=lambda t: -t[1])[: args.top]
+        for self_us, cumulative_us, module in slowest:
+            module = module.strip()
+            print(f"{self_us / 1000:9.1f} {cumulative_us / 1000:10.1f}  {module}")
+        print()
+
+    if args.max_ms is not None and totals.get("startup", float("inf")) > args.max_ms:
+        print(f"startup import exceeds {args.max_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
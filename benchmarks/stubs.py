@@ -0,0 +1,74 @@
+"""Stand-ins for the `aqt`, `anki` and `PyQt6` modules.
+
+They accept any attribute access, call or subclassing, which is enough to
+import the add-on outside of Anki.
+"""
+
+import sys
+import types
+
+STUB_MODULES = [
+    "aqt",
+    "aqt.qt",
+    "aqt.utils",
+    "aqt.editor",
+    "aqt.operations",
+    "aqt.gui_hooks",
+    "anki",
+    "anki.collection",
+    "anki.decks",
+    "anki.models",
+    "anki.notes",
+    "anki.cards",
+    "anki.hooks",
+    "anki.utils",
+    "PyQt6",
+    "PyQt6.QtCore",
+]
+
+
+class _StubMeta(type):
+    def __getattr__(cls, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return Stub
+
+
+class Stub(metaclass=_StubMeta):
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return Stub()
+
+    def __call__(self, *args, **kwargs):
+        return Stub()
+
+    def __getitem__(self, key):
+        return Stub()
+
+    def __iter__(self):
+        return iter(())
+
+
+class StubModule(types.ModuleType):
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return Stub
+
+
+def install() -> None:
+    """Registers the stub modules, unless the real ones are already loaded."""
+    for name in STUB_MODULES:
+        if name in sys.modules:
+            continue
+        module = StubModule(name)
+        module.__path__ = []  # lets `import parent.child` work
+        sys.modules[name] = module
+
+        parent, _, child = name.rpartition(".")
+        if parent:
+            setattr(sys.modules[parent], child, module)
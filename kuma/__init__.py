@@ -1,3 +1,4 @@
+import logging
 from pathlib import Path
 import sys
 
@@ -7,11 +8,24 @@ import aqt
 from aqt.utils import qconnect
 import aqt.qt
 
-from .addon import open_interface
-from .anki import KumaAnki
 
+# the messages of the add-on are shown in Anki's console, as they used to be printed
+logger = logging.getLogger(__name__)
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("%(name)s: %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
 
-action = aqt.qt.QAction("Kuma Browser", KumaAnki.window)
+
+def open_interface():
+    # the add-on and its dependencies are only imported on first use
+    from .addon import open_interface
+
+    open_interface()
+
+
+action = aqt.qt.QAction("Kuma Browser", aqt.mw)
 
 qconnect(action.triggered, open_interface)
-KumaAnki.window.form.menuTools.addAction(action)
+aqt.mw.form.menuTools.addAction(action)
@@ -1,6 +1,9 @@
 """Contains the main Widget class."""
 
 from functools import partial
+import logging
+import time
+from typing import Callable
 
 import aqt
 import aqt.qt
@@ -13,6 +16,8 @@ from .widget import JPDB_VocabListWidget
 from .jpdb_api import JPDB_API_VocabListWidget
 from .widget import RepositionWidget
 
+logger = logging.getLogger(__name__)
+
 
 class KumaBrowser_Main(aqt.QWidget):
     def __init__(self) -> None:
@@ -23,58 +28,96 @@ class KumaBrowser_Main(aqt.QWidget):
         tool_bar = aqt.QToolBar("Kuma Browser Toolbar", self)
         self._layout.addWidget(tool_bar)
 
+        # fetched once, and shared by all the tabs
+        self.decks_list = KumaAnki.deck_names()
+
+        # tabs are only built the first time they are shown
         self._actions = {}
-        self.add_action(
-            tool_bar,
-            "Search",
-            Anki_SearchWidget(self),
-        )
-        self.add_action(
-            tool_bar,
-            "JPDB",
-            JPDB_SearchWidget(self),
-        )
-        self.add_action(
-            tool_bar,
-            "JPDB VocabList",
-            JPDB_VocabListWidget(self),
-        )
-        self.add_action(
-            tool_bar,
-            "Reposition",
-            RepositionWidget(self),
-        )
-        self.add_action(
-            tool_bar,
-            "JPDB API VocabList",
-            JPDB_API_VocabListWidget(self),
-        )
+        self.add_action(tool_bar, "Search", Anki_SearchWidget)
+        self.add_action(tool_bar, "JPDB", JPDB_SearchWidget)
+        self.add_action(tool_bar, "JPDB VocabList", JPDB_VocabListWidget)
+        self.add_action(tool_bar, "Reposition", RepositionWidget)
+        self.add_action(tool_bar, "JPDB API VocabList", JPDB_API_VocabListWidget)
 
         self.show_hide(0)
         aqt.QShortcut(aqt.QKeySequence("Escape"), self, activated=self.on_Espace)
 
-    def add_action(self, toolbar: aqt.QToolBar, name: str, widget: aqt.QWidget):
+    def add_action(
+        self,
+        toolbar: aqt.QToolBar,
+        name: str,
+        create_widget: Callable[..., aqt.QWidget],
+    ):
         _action = aqt.QAction(name)
         _action.triggered.connect(partial(self.show_hide, len(self._actions)))
         _action.setCheckable(True)
         toolbar.addAction(_action)
-        self._layout.addWidget(widget)
-        self._actions[name] = {"action": _action, "widget": widget}
+        self._actions[name] = {
+            "action": _action,
+            "create_widget": create_widget,
+            "widget": None,
+        }
 
     def show_hide(self, n):
-        print(n)
         for i, v in enumerate(self._actions.values()):
             if i == n:
+                if v["widget"] is None:
+                    v["widget"] = v["create_widget"](self, decks_list=self.decks_list)
+                    self._layout.addWidget(v["widget"])
                 v["widget"].show()
                 v["action"].setChecked(True)
             else:
-                v["widget"].hide()
+                if v["widget"] is not None:
+                    v["widget"].hide()
                 v["action"].setChecked(False)
 
+    def refresh_decks(self):
+        """Updates the deck selectors of the built tabs if decks changed."""
+        decks_list = KumaAnki.deck_names()
+        if decks_list == self.decks_list:
+            return
+        self.decks_list = decks_list
+
+        for v in self._actions.values():
+            widget = v["widget"]
+            if widget is None:
+                continue
+
+            comboBox = widget.select_deck_comboBox
+            current = comboBox.currentText()
+            comboBox.blockSignals(True)
+            comboBox.clear()
+            comboBox.addItems(decks_list)
+            if current in decks_list:
+                comboBox.setCurrentIndex(decks_list.index(current))
+            comboBox.blockSignals(False)
+
+            widget.decks_list = decks_list
+            widget.current_deck = comboBox.currentText()
+
     def on_Espace(self):
         self.close()
 
 
 def open_interface():
-    KumaAnki.window.KumaBrowser_Main = KumaBrowser_Main()
-    KumaAnki.window.KumaBrowser_Main.show()
+    start_time = time.perf_counter()
+
+    # the window is only hidden when closed, and reused between opens
+    window = getattr(KumaAnki.window, "KumaBrowser_Main", None)
+    if window is None:
+        window = KumaBrowser_Main()
+        KumaAnki.window.KumaBrowser_Main = window
+    else:
+        window.refresh_decks()
+
+    window.show()
+    window.raise_()
+    window.activateWindow()
+
+    # runs once the event loop has painted the window
+    aqt.QTimer.singleShot(
+        0,
+        lambda: logger.info(
+            "Kuma Browser opened in %.0f ms", 1000 * (time.perf_counter() - start_time)
+        ),
+    )
@@ -1,6 +1,12 @@
 """Anki related functions."""
 
-from typing import Optional, List
+from bisect import bisect_right
+import json
+import logging
+import os
+from pathlib import Path
+import time
+from typing import Callable, Iterable, Optional, List
 
 import anki
 import anki.collection
@@ -8,13 +14,17 @@ import anki.decks
 import anki.models
 import anki.notes
 import anki.cards
+from anki.utils import ids2str
 
 import aqt
 import aqt.qt
 
+from . import instrumentation
 from .jpdb import JPDB_Note
 from .setup import load_template
 
+logger = logging.getLogger(__name__)
+
 
 class KumaAnki:
     model_name: str = "Kuma Model"
@@ -34,6 +44,10 @@ class KumaAnki:
             raise Exception("Decks are not available.")
         return _decks
 
+    @staticmethod
+    def deck_names() -> List[str]:
+        return KumaAnki.decks().all_names(force_default=False)
+
     @staticmethod
     def models() -> anki.models.ModelManager:
         _models = KumaAnki.collection().models
@@ -42,35 +56,121 @@ class KumaAnki:
         return _models
 
     @staticmethod
-    def create_note(note: JPDB_Note, deck_name: str) -> anki.notes.Note:
+    def model() -> anki.models.NotetypeDict:
         model = KumaAnki.models().by_name(KumaAnki.model_name)
         if model is None:
             raise Exception("Model was not found: " + KumaAnki.model_name)
+        return model
 
+    @staticmethod
+    def deck(deck_name: str) -> anki.decks.DeckDict:
         deck = KumaAnki.decks().by_name(deck_name)
         if deck is None:
             raise Exception("Deck was not found: " + deck_name)
+        return deck
+
+    @staticmethod
+    def create_note(note: JPDB_Note, deck_name: str) -> anki.notes.Note:
+        model = KumaAnki.model()
+        deck = KumaAnki.deck(deck_name)
 
         ankiNote = anki.notes.Note(KumaAnki.collection(), model)
         ankiNote.note_type()["did"] = deck["id"]
 
-        ankiNote["Expression"] = note.expression
-        ankiNote["PartOfSpeech"] = note.part_of_speech
-        ankiNote["Spelling"] = note.spelling
-        ankiNote["Pitch"] = note.pitch
-        ankiNote["Frequency"] = note.frequency
-        ankiNote["Meanings"] = note.meanings
-        ankiNote["Examples"] = note.examples
-        ankiNote["ID"] = note.note_id
+        return KumaAnki.fill_note(ankiNote, note)
+
+    @staticmethod
+    def fill_note(ankiNote: anki.notes.Note, note: JPDB_Note) -> anki.notes.Note:
+        for name, value in KumaAnki.note_fields(note).items():
+            ankiNote[name] = value
 
         return ankiNote
 
+    @staticmethod
+    def note_fields(note: JPDB_Note) -> dict[str, str]:
+        """Returns the fields of the Kuma note of a JPDB note, by name."""
+        return {
+            "Expression": note.expression,
+            "PartOfSpeech": note.part_of_speech,
+            "Spelling": note.spelling,
+            "Pitch": note.pitch,
+            "Frequency": note.frequency,
+            "Meanings": note.meanings,
+            "Examples": note.examples,
+            "ID": note.note_id,
+        }
+
     @staticmethod
     def add_note(note: JPDB_Note, deck_name: str) -> None:
         KumaAnki.add_model()
 
         ankiNote = KumaAnki.create_note(note, deck_name)
-        KumaAnki.collection().addNote(ankiNote)
+        with instrumentation.span("anki.add_note"):
+            KumaAnki.collection().addNote(ankiNote)
+
+    @staticmethod
+    def add_notes(
+        notes: Iterable[JPDB_Note],
+        deck_name: str,
+        *,
+        chunk_size: int = 500,
+        on_progress: Optional[Callable[[int], None]] = None,
+        undo_entry: Optional[int] = None,
+    ) -> List[anki.notes.Note]:
+        """Adds notes in chunks, as a single undoable operation.
+
+        The model and the deck are only resolved once. `on_progress` is called
+        after each chunk with the number of notes processed so far. Passing
+        the `undo_entry` of a previous call merges both calls in one undo step.
+
+        Returns the notes that were added.
+        """
+        KumaAnki.add_model()
+        model = KumaAnki.model()
+        deck_id = KumaAnki.deck(deck_name)["id"]
+
+        col = KumaAnki.collection()
+        if undo_entry is None:
+            undo_entry = KumaAnki.add_undo_entry()
+
+        notes = list(notes)
+        added = []
+        start_time = time.perf_counter()
+        for start in range(0, len(notes), chunk_size):
+            chunk = [
+                KumaAnki.fill_note(anki.notes.Note(col, model), n)
+                for n in notes[start : start + chunk_size]
+            ]
+            with instrumentation.span("anki.add_notes"):
+                try:
+                    col.add_notes(
+                        [anki.collection.AddNoteRequest(n, deck_id) for n in chunk]
+                    )
+                    added += chunk
+                except Exception:
+                    # fall back to one write per note to only skip the faulty ones
+                    for n in chunk:
+                        try:
+                            col.add_note(n, deck_id)
+                            added.append(n)
+                        except Exception:
+                            continue
+                col.merge_undo_entries(undo_entry)
+
+            if on_progress is not None:
+                on_progress(min(start + chunk_size, len(notes)))
+
+        instrumentation.count("anki.notes_added", len(added))
+        elapsed = time.perf_counter() - start_time
+        if elapsed > 0:
+            logger.info(
+                "Added %d notes (%.1f notes/sec)", len(added), len(added) / elapsed
+            )
+        return added
+
+    @staticmethod
+    def add_undo_entry() -> int:
+        return KumaAnki.collection().add_custom_undo_entry("Add Kuma Notes")
 
     @staticmethod
     def find_notes(query: Optional[str] = None) -> List[int]:
@@ -78,6 +178,32 @@ class KumaAnki:
             return []
         return list(map(int, KumaAnki.collection().find_notes(query)))
 
+    @staticmethod
+    def search_expressions(
+        query: str, col: Optional[anki.collection.Collection] = None
+    ) -> List[tuple[int, str]]:
+        """Returns the (note id, first field) of the notes matching a query.
+
+        Only the first field is read, in a single query, so this is safe to run
+        in a background operation with the collection it was given.
+        """
+        if query is None or query == "":
+            return []
+        col = col if col is not None else KumaAnki.collection()
+
+        nids = list(map(int, col.find_notes(query)))
+        if len(nids) == 0:
+            return []
+
+        expressions = dict(
+            col.db.all(
+                "select id, case when instr(flds, char(31)) > 0 "
+                "then substr(flds, 1, instr(flds, char(31)) - 1) else flds end "
+                f"from notes where id in {ids2str(nids)}"
+            )
+        )
+        return [(nid, expressions.get(nid, "")) for nid in nids]
+
     @staticmethod
     def add_model() -> None:
         if KumaAnki.model_name in [
@@ -103,6 +229,122 @@ class KumaAnki:
 
         KumaAnki.models().add(m)
 
+    @staticmethod
+    def has_note(deck_name: str, note_id: str) -> bool:
+        """Returns whether a deck has a Kuma note with this ID field.
+
+        A single search, for one-off checks; bulk imports use `DeckIdIndex`.
+        """
+        query = f'"deck:{deck_name}" "note:{KumaAnki.model_name}" "ID:{note_id}"'
+        return len(KumaAnki.find_notes(query)) > 0
+
+    @staticmethod
+    def note_ids_in_deck(deck_name: str) -> set[str]:
+        """Returns the ID field of every Kuma note of a deck."""
+        return set(KumaAnki.notes_by_id(deck_name))
+
+    @staticmethod
+    def notes_by_id(deck_name: str) -> dict[str, int]:
+        """Maps the ID field of every Kuma note of a deck to the note id."""
+        if KumaAnki.models().by_name(KumaAnki.model_name) is None:
+            return {}
+        model = KumaAnki.model()
+        id_index = KumaAnki.models().field_map(model)["ID"][0]
+
+        nids = KumaAnki.find_notes(f'"deck:{deck_name}" "note:{KumaAnki.model_name}"')
+        if len(nids) == 0:
+            return {}
+
+        return {
+            flds.split("\x1f")[id_index]: nid
+            for nid, flds in KumaAnki.collection().db.all(
+                f"select id, flds from notes where id in {ids2str(nids)}"
+            )
+        }
+
+    @staticmethod
+    def update_notes(
+        notes: Iterable[JPDB_Note],
+        deck_name: str,
+        *,
+        fields: Optional[Iterable[str]] = None,
+        undo_entry: Optional[int] = None,
+    ) -> List[anki.notes.Note]:
+        """Updates the Kuma notes of a deck with the same ID as `notes`.
+
+        Only `fields` are compared and written when given, every field
+        otherwise. The notes of the deck are read with a single query, and
+        the ones that changed are written with a single update, merged in the
+        undo step of `undo_entry` when given.
+
+        Returns the notes that were updated.
+        """
+        if KumaAnki.models().by_name(KumaAnki.model_name) is None:
+            return []
+        model = KumaAnki.model()
+        field_map = KumaAnki.models().field_map(model)
+        id_index = field_map["ID"][0]
+
+        incoming = {}
+        for note in notes:
+            values = KumaAnki.note_fields(note)
+            if fields is not None:
+                values = {name: values[name] for name in fields}
+            incoming[note.note_id] = [
+                (field_map[name][0], value) for name, value in values.items()
+            ]
+
+        nids = KumaAnki.find_notes(f'"deck:{deck_name}" "note:{KumaAnki.model_name}"')
+        if len(incoming) == 0 or len(nids) == 0:
+            return []
+
+        col = KumaAnki.collection()
+        updated = []
+        with instrumentation.span("anki.update_notes"):
+            for nid, guid, mid, mod, usn, tags, flds in col.db.all(
+                "select id, guid, mid, mod, usn, tags, flds from notes "
+                f"where id in {ids2str(nids)}"
+            ):
+                note_fields = flds.split("\x1f")
+                changes = incoming.get(note_fields[id_index])
+                if changes is None or all(
+                    note_fields[i] == value for i, value in changes
+                ):
+                    continue
+                for i, value in changes:
+                    note_fields[i] = value
+
+                # built from the row, instead of being loaded one by one
+                ankiNote = anki.notes.Note(col, model)
+                ankiNote.id, ankiNote.guid, ankiNote.mid = nid, guid, mid
+                ankiNote.mod, ankiNote.usn = mod, usn
+                ankiNote.tags = tags.split()
+                ankiNote.fields = note_fields
+                updated.append(ankiNote)
+
+            if len(updated) > 0:
+                col.update_notes(updated)
+                if undo_entry is not None:
+                    col.merge_undo_entries(undo_entry)
+
+        instrumentation.count("anki.notes_updated", len(updated))
+        logger.info("Updated %d of %d notes", len(updated), len(incoming))
+        return updated
+
+    @staticmethod
+    def remove_notes(nids: List[int], undo_entry: Optional[int] = None) -> int:
+        """Removes notes, in the undo step of `undo_entry` when given."""
+        if len(nids) == 0:
+            return 0
+        col = KumaAnki.collection()
+        with instrumentation.span("anki.remove_notes"):
+            col.remove_notes(nids)
+        if undo_entry is not None:
+            col.merge_undo_entries(undo_entry)
+        instrumentation.count("anki.notes_removed", len(nids))
+        logger.info("Removed %d notes", len(nids))
+        return len(nids)
+
     @staticmethod
     def find_cards(query: Optional[str] = None) -> Optional[int]:
         if query is None or query == "":
@@ -118,33 +360,222 @@ class KumaAnki:
 from operator import itemgetter
 
 
-def reposition_on_frequency(deck_name: str) -> None:
-    notes_id = KumaAnki.find_notes(f'"deck:{deck_name}"')
-    notes = [KumaAnki.collection().get_note(i) for i in notes_id]
+def frequency_of(flds: str) -> int:
+    """Returns the Frequency field of a note, from its raw fields."""
+    fields = flds.split("\x1f")
+    frequency = fields[4] if len(fields) > 4 else ""
+    try:
+        return int(frequency)
+    except ValueError:
+        return 200_000
 
-    name_freq = []
-    for n in notes:
-        frequency = n.fields[4]
-        if frequency == "" or frequency is None:
-            frequency = 200_000
-        else:
-            frequency = int(frequency)
 
-        name_freq.append((n.id, frequency))
+ORDERINGS_PATH = Path(__file__).parent.joinpath("reposition")
+
+
+def load_ordering(deck_id: int) -> Optional[dict]:
+    """Returns the last applied frequency ordering of a deck.
+
+    The ordering holds the sorted `frequencies` of the deck's notes, and the
+    due `positions` given to them.
+    """
+    path = ORDERINGS_PATH.joinpath(str(deck_id) + ".json")
+    if not path.exists():
+        return None
+    with path.open("r") as f:
+        return json.load(f)
 
+
+def save_ordering(deck_id: int, ordering: dict) -> None:
+    os.makedirs(ORDERINGS_PATH, exist_ok=True)
+    with ORDERINGS_PATH.joinpath(str(deck_id) + ".json").open("w") as f:
+        json.dump(ordering, f)
+
+
+def _position_runs(notes: List[tuple]) -> List[list]:
+    """Groups (position, card ids, dues) notes, sorted by position, in runs
+    that a single `reposition_new_cards` can write: consecutive positions,
+    whose cards are already in that order.
+
+    Returns [starting position, card ids] runs.
+    """
+    runs = []
+    last_position = last_due = None
+    for position, cids, dues in notes:
+        if len(runs) > 0 and position == last_position + 1 and min(dues) > last_due:
+            runs[-1][1].extend(cids)
+        else:
+            runs.append([position, list(cids)])
+        last_position, last_due = position, max(dues)
+    return runs
+
+
+def _reposition(cids: List[int], starting_from: int) -> None:
+    KumaAnki.collection().sched.reposition_new_cards(
+        card_ids=cids,
+        starting_from=starting_from,
+        step_size=1,
+        randomize=False,
+        shift_existing=False,
+    )
+
+
+def set_due_positions(
+    updates: List[tuple], undo_entry: int
+) -> anki.collection.OpChanges:
+    """Sets the due position of new cards, from (position, note id, card id,
+    current due) rows.
+
+    Positions are written with `sched.reposition_new_cards`, which numbers
+    the notes of the cards it is given from `starting_from`, in the order of
+    their current due. Notes on consecutive positions that are already in
+    that order are written with a single call. When the cards are mostly out
+    of order, e.g. on the first reposition of a deck, they are first sorted
+    with a radix sort on the rank of their position, two calls per bit. The
+    calls are merged in the undo step of `undo_entry`.
+    """
+    notes = {}
+    for position, nid, cid, due in updates:
+        if nid not in notes:
+            notes[nid] = (position, [], [])
+        notes[nid][1].append(cid)
+        notes[nid][2].append(due)
+    ordered = sorted(notes.values(), key=lambda note: (note[0], min(note[2])))
+
+    runs = _position_runs(ordered)
+    # the runs once the cards are in the order of their positions
+    ranked = [(p, cids, [rank]) for rank, (p, cids, _) in enumerate(ordered)]
+    sorted_runs = _position_runs(ranked)
+    n_calls = 0
+    bits = len(ordered).bit_length()
+    if len(runs) - len(sorted_runs) > 2 * bits:
+        for bit in range(bits):
+            low, high = [], []
+            for rank, (_, cids, _) in enumerate(ordered):
+                (high if rank >> bit & 1 else low).append(cids)
+            for starting_from, group in ((0, low), (len(low), high)):
+                if len(group) > 0:
+                    _reposition([cid for cids in group for cid in cids], starting_from)
+                    n_calls += 1
+        # the due of the cards of each note is now its rank
+        runs = sorted_runs
+
+    for starting_from, cids in runs:
+        _reposition(cids, starting_from)
+    instrumentation.count("anki.reposition_calls", n_calls + len(runs))
+    return KumaAnki.collection().merge_undo_entries(undo_entry)
+
+
+def reposition_on_frequency(
+    deck_name: str,
+    *,
+    incremental: bool = True,
+    on_progress: Optional[Callable[[int], None]] = None,
+) -> anki.collection.OpChangesWithCount:
+    """Sets the due position of the new cards of a deck by frequency.
+
+    Cards of the same note share their position. Reads are done in bulk and
+    the positions written by runs of notes (see `set_due_positions`),
+    `on_progress` is called with the number of steps done (out of 4). When
+    `incremental`, only the cards whose position changes are written.
+
+    Meant to run as a `CollectionOp`, in a single undo step. Returns the
+    changes, with the number of repositioned cards as count.
+    """
+
+    def progress(step: int):
+        if on_progress is not None:
+            on_progress(step)
+
+    col = KumaAnki.collection()
+    notes_id = KumaAnki.find_notes(f'"deck:{deck_name}"')
+    if len(notes_id) == 0:
+        return anki.collection.OpChangesWithCount(count=0)
+    undo_entry = col.add_custom_undo_entry("Reposition Kuma Cards")
+    progress(1)
+
+    frequencies = dict(
+        col.db.all(f"select id, flds from notes where id in {ids2str(notes_id)}")
+    )
+    name_freq = [(i, frequency_of(frequencies[i])) for i in notes_id]
     name_freq.sort(key=itemgetter(1))
+    progress(2)
+
+    new_cards = col.db.all(
+        "select id, nid, due from cards "
+        f"where type = 0 and nid in {ids2str(notes_id)}"
+    )
+    has_new = {nid for _, nid, _ in new_cards}
+    # notes without new cards share the position of the previous note, so
+    # that the positions of the new cards are consecutive
+    position, positions, p = {}, [], 0
+    for nid, _ in name_freq:
+        position[nid] = p if nid in has_new else max(p - 1, 0)
+        positions.append(position[nid])
+        p += nid in has_new
+    progress(3)
+
+    updates = [
+        (position[nid], nid, cid, due)
+        for cid, nid, due in new_cards
+        if not incremental or due != position[nid]
+    ]
+    changes = set_due_positions(updates, undo_entry)
+    save_ordering(
+        KumaAnki.deck(deck_name)["id"],
+        {"frequencies": [item[1] for item in name_freq], "positions": positions},
+    )
+    progress(4)
+
+    return anki.collection.OpChangesWithCount(changes=changes, count=len(updates))
+
+
+@instrumentation.timed("anki.slot_notes")
+def slot_notes_on_frequency(
+    deck_name: str, notes: List[anki.notes.Note], undo_entry: Optional[int] = None
+) -> int:
+    """Inserts new notes in the last frequency ordering applied to a deck.
+
+    Each note is placed by binary search next to the notes of similar
+    frequency, sharing their position, so the rest of the deck is untouched.
+    Does nothing if the deck was never repositioned. The cards are written in
+    the undo step of `undo_entry`, the one of the added notes.
+
+    Returns the number of repositioned cards.
+    """
+    if len(notes) == 0:
+        return 0
+
+    deck_id = KumaAnki.deck(deck_name)["id"]
+    ordering = load_ordering(deck_id)
+    if ordering is None:
+        return 0
+    frequencies, positions = ordering["frequencies"], ordering["positions"]
+
+    position = {}
+    for n in notes:
+        frequency = frequency_of(n.joined_fields())
+        i = bisect_right(frequencies, frequency)
+        if i > 0:
+            p = positions[i - 1]
+        else:
+            p = positions[0] if len(positions) > 0 else 0
+        frequencies.insert(i, frequency)
+        positions.insert(i, p)
+        position[n.id] = p
 
-    cards_to_update = []
-    for i, item in enumerate(name_freq):
-        cards_id = KumaAnki.get_cards_of_note(item[0])
-        for _id in cards_id:
-            card = KumaAnki.collection().get_card(_id)
-            if card.type > 0:
-                continue
-            card.due = i
-            cards_to_update.append(card)
-    KumaAnki.collection().update_cards(cards_to_update)
-    # expression, frequency
+    new_cards = KumaAnki.collection().db.all(
+        "select id, nid, due from cards "
+        f"where type = 0 and nid in {ids2str(position)}"
+    )
+    if undo_entry is None:
+        undo_entry = KumaAnki.add_undo_entry()
+    set_due_positions(
+        [(position[nid], nid, cid, due) for cid, nid, due in new_cards], undo_entry
+    )
+    save_ordering(deck_id, ordering)
+
+    return len(new_cards)
 
 
 def equal_note(
@@ -157,10 +588,22 @@ def equal_note(
     return True
 
 
-def is_in_deck(deck: str, note_id: str) -> bool:
-    query = f'"deck:{deck}" ID:{note_id}'
-    try:
-        return len(KumaAnki.find_notes(query))
-    except:
-        print(query)
-        return True  # won't create
+class DeckIdIndex:
+    """Set of the ID fields of the Kuma notes in a deck.
+
+    Loaded with a single query, then kept up to date with `add`.
+    """
+
+    def __init__(self, deck_name: str):
+        self.deck_name = deck_name
+        with instrumentation.span("anki.deck_index"):
+            self.ids = KumaAnki.note_ids_in_deck(deck_name)
+
+    def __contains__(self, note_id: str) -> bool:
+        return str(note_id) in self.ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, note_id: str) -> None:
+        self.ids.add(str(note_id))
@@ -0,0 +1,115 @@
+"""Persistent cache of the pages downloaded from JPDB."""
+
+from dataclasses import dataclass
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import Optional
+import zlib
+
+CACHE_PATH = Path(__file__).parent.joinpath("http_cache.sqlite")
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.time() - self.fetched_at < ttl
+
+
+class ResponseCache:
+    """Compressed responses keyed by url, with a TTL and LRU eviction.
+
+    Responses older than `ttl` seconds are still returned so that they can
+    be revalidated with their ETag / Last-Modified headers.
+    """
+
+    def __init__(self, path: Path = CACHE_PATH, *, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("pragma journal_mode = wal")
+        self._db.execute(
+            "create table if not exists responses ("
+            "url text primary key, body blob not null, size integer not null, "
+            "etag text, last_modified text, "
+            "fetched_at real not null, accessed_at real not null)"
+        )
+        self._db.execute(
+            "create index if not exists responses_accessed "
+            "on responses (accessed_at)"
+        )
+        self._db.commit()
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        with self._lock:
+            row = self._db.execute(
+                "select body, etag, last_modified, fetched_at "
+                "from responses where url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "update responses set accessed_at = ? where url = ?",
+                (time.time(), url),
+            )
+            self._db.commit()
+
+        body, etag, last_modified, fetched_at = row
+        return CachedResponse(zlib.decompress(body), etag, last_modified, fetched_at)
+
+    def put(
+        self,
+        url: str,
+        body: bytes,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> None:
+        compressed = zlib.compress(body)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "insert or replace into responses values (?, ?, ?, ?, ?, ?, ?)",
+                (url, compressed, len(compressed), etag, last_modified, now, now),
+            )
+            self._evict()
+            self._db.commit()
+
+    def touch(self, url: str) -> None:
+        """Marks a response as fresh again, after a 304 Not Modified."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "update responses set fetched_at = ?, accessed_at = ? where url = ?",
+                (now, now, url),
+            )
+            self._db.commit()
+
+    def _evict(self) -> None:
+        total = self._db.execute("select coalesce(sum(size), 0) from responses")
+        excess = total.fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+
+        to_delete = []
+        for url, size in self._db.execute(
+            "select url, size from responses order by accessed_at"
+        ):
+            to_delete.append((url,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._db.executemany("delete from responses where url = ?", to_delete)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("delete from responses")
+            self._db.commit()
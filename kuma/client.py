@@ -0,0 +1,194 @@
+"""Shared HTTP client for all JPDB requests."""
+
+import json
+from pathlib import Path
+import threading
+from typing import Callable, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import instrumentation
+from .cache import ResponseCache
+from .ratelimit import TokenBucket
+
+CONFIG_PATH = Path(__file__).parent.joinpath("config", "http.json")
+
+DEFAULT_CONFIG = {
+    "base_url": "https://jpdb.io",
+    "connect_timeout": 5.0,
+    "read_timeout": 30.0,
+    "retries": 5,
+    "backoff_factor": 0.5,
+    "pool_size": 8,
+    "cache": True,
+    "cache_max_mb": 200,
+    "cache_ttl_hours": 72,
+}
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_session: Optional[requests.Session] = None
+_config: Optional[dict] = None
+_cache: Optional[ResponseCache] = None
+_lock = threading.Lock()
+
+_throttle_listeners: List[Callable[[], None]] = []
+
+
+def add_throttle_listener(listener: Callable[[], None]) -> None:
+    """Registers a callback run each time the server answers 429."""
+    _throttle_listeners.append(listener)
+
+
+def remove_throttle_listener(listener: Callable[[], None]) -> None:
+    if listener in _throttle_listeners:
+        _throttle_listeners.remove(listener)
+
+
+class _Retry(Retry):
+    """Retry that also reports the throttled responses it retries."""
+
+    def increment(self, method=None, url=None, response=None, *args, **kwargs):
+        instrumentation.count("http.retries")
+        if response is not None and response.status == 429:
+            instrumentation.count("http.throttled")
+            for listener in list(_throttle_listeners):
+                listener()
+        return super().increment(method, url, response, *args, **kwargs)
+
+
+def load_config() -> dict:
+    config = dict(DEFAULT_CONFIG)
+    if CONFIG_PATH.exists():
+        with CONFIG_PATH.open("r") as f:
+            config.update(json.load(f))
+    return config
+
+
+def create_session(config: dict) -> requests.Session:
+    retry = _Retry(
+        total=config["retries"],
+        backoff_factor=config["backoff_factor"],
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=None,  # API lookups are safe to replay
+        respect_retry_after_header=True,
+        raise_on_status=False,  # give the last response back to the caller
+    )
+    adapter = HTTPAdapter(
+        pool_connections=config["pool_size"],
+        pool_maxsize=config["pool_size"],
+        max_retries=retry,
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    return session
+
+
+def session() -> requests.Session:
+    global _session, _config
+    with _lock:
+        if _session is None:
+            _config = load_config()
+            _session = create_session(_config)
+        return _session
+
+
+def configure(**overrides) -> None:
+    """Recreates the session with some settings of http.json overridden."""
+    global _session, _config, _cache
+    with _lock:
+        _config = {**load_config(), **overrides}
+        _session = create_session(_config)
+        _cache = None
+
+
+def timeout() -> tuple[float, float]:
+    session()
+    return (_config["connect_timeout"], _config["read_timeout"])
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault("timeout", timeout())
+    with instrumentation.span("http.get"):
+        response = session().get(url, **kwargs)
+    instrumentation.count("http.bytes", len(response.content))
+    return response
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    kwargs.setdefault("timeout", timeout())
+    with instrumentation.span("http.post"):
+        response = session().post(url, **kwargs)
+    instrumentation.count("http.bytes", len(response.content))
+    return response
+
+
+def response_cache() -> Optional[ResponseCache]:
+    global _cache
+    session()
+    with _lock:
+        if _cache is None and _config["cache"]:
+            _cache = ResponseCache(
+                max_bytes=int(_config["cache_max_mb"] * 1024 * 1024),
+                ttl=_config["cache_ttl_hours"] * 3600,
+            )
+        return _cache
+
+
+def get_page(
+    url: str, revalidate: bool = False, limiter: Optional[TokenBucket] = None
+) -> bytes:
+    """Returns the content of a page, from the response cache when possible.
+
+    Stale responses are revalidated with their ETag / Last-Modified headers,
+    and so are fresh ones when `revalidate` is set. A token of `limiter` is
+    only taken when the request goes to the network. Raises
+    `requests.HTTPError` when the page could not be loaded.
+    """
+    cache = response_cache()
+    cached = cache.get(url) if cache is not None else None
+    if cached is not None and not revalidate and cached.is_fresh(cache.ttl):
+        instrumentation.count("cache.hits")
+        return cached.body
+
+    headers = {}
+    if cached is not None:
+        if cached.etag:
+            headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            headers["If-Modified-Since"] = cached.last_modified
+
+    if limiter is not None:
+        with instrumentation.span("ratelimit.wait"):
+            limiter.acquire()
+    response = get(url, headers=headers)
+    if response.status_code == 304 and cached is not None:
+        instrumentation.count("cache.revalidated")
+        cache.touch(url)
+        if limiter is not None:
+            limiter.succeeded()
+        return cached.body
+
+    if cache is not None:
+        instrumentation.count("cache.misses")
+    if response.status_code != 200:
+        # e.g. a 429 left after the retries, not a page to parse
+        raise requests.HTTPError(
+            f"{response.status_code} response for {url}", response=response
+        )
+
+    if limiter is not None:
+        limiter.succeeded()
+    if cache is not None:
+        cache.put(
+            url,
+            response.content,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
+    return response.content
@@ -0,0 +1,178 @@
+"""Crawling of JPDB vocabulary lists."""
+
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Callable, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from .jpdb import JPDB, load_url, get_all_entries_from_one_page
+from .ratelimit import TokenBucket
+
+CACHE_PATH = Path(__file__).parent.joinpath("vocab_lists")
+
+
+class VocabListCache:
+    """Entries of a vocabulary list, and the checkpoint of its crawl."""
+
+    def __init__(self, vocab_list: str, path: Optional[Path] = None):
+        self.path = path if path is not None else CACHE_PATH
+        _, _, url_path, query, _ = urlsplit(vocab_list)
+        self.key = url_path.split("/")[-2]
+        if query != "":
+            # another sort order or starting offset is another list
+            self.key += "-" + hashlib.sha1(query.encode("utf-8")).hexdigest()[:8]
+
+    @property
+    def entries_path(self) -> Path:
+        return self.path.joinpath(self.key)
+
+    @property
+    def checkpoint_path(self) -> Path:
+        return self.path.joinpath(self.key + ".partial")
+
+    def save_urls(self, urls: List[str]) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        with self.entries_path.open("w") as f:
+            json.dump(urls, f)
+        self.checkpoint_path.unlink(missing_ok=True)
+
+    def load_urls(self) -> List[str]:
+        if not self.entries_path.exists():
+            return []
+        with self.entries_path.open("r") as f:
+            return json.load(f)
+
+    def append_page(self, page: dict) -> None:
+        """Checkpoints one crawled page, as a line of the partial file."""
+        os.makedirs(self.path, exist_ok=True)
+        with self.checkpoint_path.open("a") as f:
+            f.write(json.dumps(page) + "\n")
+
+    def load_pages(self) -> List[dict]:
+        if not self.checkpoint_path.exists():
+            return []
+
+        pages = []
+        with self.checkpoint_path.open("r") as f:
+            for line in f:
+                try:
+                    pages.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break  # interrupted while writing this page
+        return pages
+
+
+def page_url(vl_url: str, offset: int) -> str:
+    """Returns the url of the page at `offset`, keeping the other parameters
+    of the list url, e.g. its sort order."""
+    scheme, netloc, path, query, _ = urlsplit(vl_url)
+    params = [(k, v) for k, v in parse_qsl(query) if k != "offset"]
+    if offset > 0:
+        params.append(("offset", str(offset)))
+    return urlunsplit((scheme, netloc, path, urlencode(params), ""))
+
+
+def start_offset(vl_url: str) -> int:
+    """Returns the offset of the list url, where the crawl starts."""
+    offset = dict(parse_qsl(urlsplit(vl_url).query)).get("offset", "0")
+    return int(offset) if offset.isdigit() else 0
+
+
+def is_last_page(jpdb_soup, entries: List[str], page_size: int) -> bool:
+    if len(entries) == 0 or len(entries) < page_size:
+        return True
+    if jpdb_soup.find(class_="pagination") is None:
+        return True
+    return jpdb_soup.find(class_="pagination without-next") is not None
+
+
+class VocabListCrawler:
+    """Iterative crawler of the pages of a vocabulary list.
+
+    The discovered entries are checkpointed after every page, so that an
+    interrupted crawl resumes where it stopped. Once the page size is known,
+    the next pages are prefetched concurrently since their offsets are
+    predictable. With `revalidate`, the cached pages are checked against the
+    server, so that a sync sees the current list.
+    """
+
+    def __init__(
+        self,
+        vl_url: str,
+        cache: VocabListCache,
+        limiter: TokenBucket,
+        *,
+        prefetch: int = 4,
+        on_page: Optional[Callable[[int], None]] = None,
+        revalidate: bool = False,
+    ):
+        self.vl_url = vl_url
+        self.cache = cache
+        self.limiter = limiter
+        self.prefetch = max(1, prefetch)
+        self.on_page = on_page
+        self.revalidate = revalidate
+
+    def load_page(self, offset: int) -> tuple:
+        jpdb_soup = load_url(
+            page_url(self.vl_url, offset), self.revalidate, self.limiter
+        )
+
+        entries = get_all_entries_from_one_page(jpdb_soup)
+        entries = [JPDB.base_url + e.strip("#a") for e in entries]
+        return jpdb_soup, entries
+
+    def crawl(self) -> List[str]:
+        pages = self.cache.load_pages()
+        if len(pages) == 0:
+            offset = start_offset(self.vl_url)
+            jpdb_soup, entries = self.load_page(offset)
+            page = {
+                "offset": offset,
+                "page_size": len(entries),
+                "entries": entries,
+                "done": is_last_page(jpdb_soup, entries, len(entries)),
+            }
+            self.cache.append_page(page)
+            pages.append(page)
+
+        entries = [e for page in pages for e in page["entries"]]
+        page_size = pages[0]["page_size"]
+        done = pages[-1]["done"]
+        self._on_page(entries)
+
+        with ThreadPoolExecutor(max_workers=self.prefetch) as pool:
+            pending = deque()
+            next_offset = pages[-1]["offset"] + page_size
+
+            while not done:
+                while len(pending) < self.prefetch:
+                    pending.append(
+                        (next_offset, pool.submit(self.load_page, next_offset))
+                    )
+                    next_offset += page_size
+
+                # pages are consumed in order, the checkpoint stays contiguous
+                offset, future = pending.popleft()
+                jpdb_soup, page_entries = future.result()
+                done = is_last_page(jpdb_soup, page_entries, page_size)
+
+                self.cache.append_page(
+                    {"offset": offset, "entries": page_entries, "done": done}
+                )
+                entries += page_entries
+                self._on_page(entries)
+
+            for _, future in pending:
+                future.cancel()
+
+        self.cache.save_urls(entries)
+        return entries
+
+    def _on_page(self, entries: List[str]) -> None:
+        if self.on_page is not None:
+            self.on_page(len(entries))
@@ -0,0 +1,214 @@
+"""Timing spans and counters around the hot paths of the imports.
+
+Nothing is recorded outside of a `Recording`, and the spans then only cost a
+global lookup. A recording is enabled by the `instrumentation` key of
+`config/vl.json` and `config/api.json`.
+"""
+
+from collections import Counter, defaultdict
+from datetime import datetime
+from functools import wraps
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+REPORTS_PATH = Path(__file__).parent.joinpath("reports")
+
+
+class Recorder:
+    """Durations of the spans, and counters, of one run."""
+
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        self.counters: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name: str, duration: float) -> None:
+        with self._lock:
+            self.durations[name].append(duration)
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def stages(self) -> dict:
+        with self._lock:
+            durations = {name: sorted(d) for name, d in self.durations.items()}
+
+        return {
+            name: {
+                "count": len(d),
+                "total_s": sum(d),
+                "p50_ms": 1000 * percentile(d, 50),
+                "p95_ms": 1000 * percentile(d, 95),
+                "max_ms": 1000 * d[-1],
+            }
+            for name, d in sorted(durations.items())
+        }
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if len(sorted_values) == 0:
+        return 0.0
+    rank = max(0, -(-len(sorted_values) * p // 100) - 1)
+    return sorted_values[int(rank)]
+
+
+_recorder: Optional[Recorder] = None
+
+
+class _Span:
+    __slots__ = ("recorder", "name", "start")
+
+    def __init__(self, recorder: Recorder, name: str):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name: str):
+    """Times the body of a `with` block, when a recording is active."""
+    recorder = _recorder
+    if recorder is None:
+        return _NULL_SPAN
+    return _Span(recorder, name)
+
+
+def timed(name: str):
+    """Decorator timing every call of a function, as a span."""
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, n: int = 1) -> None:
+    recorder = _recorder
+    if recorder is not None:
+        recorder.count(name, n)
+
+
+class Recording:
+    """Records the spans and counters of a run, when `enabled`.
+
+    On exit, the report is saved as json in `kuma/reports` and its summary is
+    logged. Runs started while another one is recording are counted in it.
+    """
+
+    def __init__(self, name: str, enabled: bool):
+        self.name = name
+        self.enabled = enabled
+        self.recorder: Optional[Recorder] = None
+        self.report: Optional[dict] = None
+        self.path: Optional[Path] = None
+
+    def __enter__(self) -> "Recording":
+        global _recorder
+        if self.enabled and _recorder is None:
+            self.recorder = _recorder = Recorder()
+            self._started_at = datetime.now()
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        global _recorder
+        if self.recorder is None:
+            return False
+        _recorder = None
+
+        self.report = {
+            "name": self.name,
+            "started_at": self._started_at.isoformat(timespec="seconds"),
+            "wall_s": time.perf_counter() - self._start,
+            "stages": self.recorder.stages(),
+            "counters": dict(self.recorder.counters),
+        }
+        try:
+            self.path = save_report(self.report)
+        except OSError as e:
+            logger.warning("could not save the report of %s: %s", self.name, e)
+        logger.info("%s", self.summary())
+        return False
+
+    def summary(self) -> Optional[str]:
+        if self.report is None:
+            return None
+        return format_summary(self.report)
+
+
+def save_report(report: dict) -> Path:
+    os.makedirs(REPORTS_PATH, exist_ok=True)
+    started_at = report["started_at"].replace(":", "").replace("-", "")
+    path = REPORTS_PATH.joinpath(f"{report['name']}-{started_at}.json")
+    with path.open("w") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def format_summary(report: dict) -> str:
+    lines = [
+        f"{report['name']}: {report['wall_s']:.1f}s",
+        f"{'stage':<20}{'count':>8}{'total':>10}{'p50':>10}{'p95':>10}",
+    ]
+    for name, stage in report["stages"].items():
+        lines.append(
+            f"{name:<20}{stage['count']:>8}{stage['total_s']:>9.2f}s"
+            f"{stage['p50_ms']:>8.1f}ms{stage['p95_ms']:>8.1f}ms"
+        )
+
+    counters = report["counters"]
+    lines.append(
+        f"downloaded {counters.get('http.bytes', 0) / 1024**2:.1f} MB, "
+        f"cache hits {counters.get('cache.hits', 0)}, "
+        f"retries {counters.get('http.retries', 0)} "
+        f"({counters.get('http.throttled', 0)} throttled)"
+    )
+    for name, value in sorted(counters.items()):
+        if name not in ("http.bytes", "cache.hits", "http.retries", "http.throttled"):
+            lines.append(f"{name}: {value}")
+    return "\n".join(lines)
+
+
+def show_report(recording: Optional[Recording]) -> None:
+    """Opens a dialog with the summary of a recording, if there is one."""
+    if recording is None or recording.report is None:
+        return
+    from aqt.utils import showText
+
+    summary = recording.summary()
+    if recording.path is not None:
+        summary += f"\n\nReport saved to {recording.path}"
+    showText(summary, title="Kuma Browser - " + recording.name, copyBtn=True)
@@ -1,44 +1,96 @@
 """JPDB related functions."""
 
 from dataclasses import dataclass
-import json
-from pathlib import Path
 import re
-from typing import List
+from typing import List, Optional
 
-from bs4 import BeautifulSoup
-import requests
+from bs4 import BeautifulSoup, Tag
 
+from . import client
+from . import instrumentation
 from .pitch import get_pitch_html
+from .pitch_dictionary import PITCH_DICTIONARY
+from .ratelimit import TokenBucket
 
 Url = str
 
-PITCH_DICTIONARY = json.load(
-    open(Path(__file__).parent.joinpath("pitch_dictionary.json"), "r")
-)
 
+try:
+    import lxml  # noqa: F401
 
-def load_url(url: Url) -> BeautifulSoup:
-    return BeautifulSoup(requests.get(url).content, "html.parser")
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+
+def parse_html(content: bytes, parser: Optional[str] = None) -> BeautifulSoup:
+    return BeautifulSoup(content, parser or PARSER)
+
+
+def load_url(
+    url: Url, revalidate: bool = False, limiter: Optional[TokenBucket] = None
+) -> BeautifulSoup:
+    content = client.get_page(url, revalidate, limiter)
+    with instrumentation.span("jpdb.parse"):
+        return parse_html(content)
 
 
 class JPDB:
-    base_url = "https://jpdb.io"
+    base_url = client.load_config()["base_url"]
 
     @staticmethod
     def search_url(query: str) -> Url:
-        return "https://jpdb.io/search?q=" + query
+        return JPDB.base_url + "/search?q=" + query
+
+
+# class of the sections of a vocabulary page, as matched by `find(class_=...)`
+SECTION_CLASSES = [
+    "part-of-speech",
+    "primary-spelling",
+    "tag tooltip",
+    "subsection-meanings",
+    "subsection-examples",
+]
+
+
+def find_sections(jpdb_soup: BeautifulSoup) -> dict[str, Tag]:
+    """Finds the first element of every section of a vocabulary page.
 
+    Equivalent to one `find` per section, in a single traversal.
+    """
+    sections = {}
+    n_sections = len(SECTION_CLASSES) + 2
 
-def extract_part_of_speech(jpdb_soup: BeautifulSoup) -> str:
+    for tag in jpdb_soup.descendants:
+        if not isinstance(tag, Tag):
+            continue
+
+        if tag.name == "title":
+            sections.setdefault("title", tag)
+        elif tag.name == "meta" and tag.get("name") == "description":
+            sections.setdefault("description", tag)
+
+        classes = tag.get("class")
+        if classes:
+            for c in SECTION_CLASSES:
+                if c not in sections and (c in classes or " ".join(classes) == c):
+                    sections[c] = tag
+
+        if len(sections) == n_sections:
+            break
+
+    return sections
+
+
+def extract_part_of_speech(section: Tag) -> str:
     part_of_speech = ""
-    for speech in jpdb_soup.find(class_="part-of-speech").contents:
+    for speech in section.contents:
         part_of_speech += speech.text + "\n"
     return part_of_speech
 
 
-def extract_spelling(jpdb_soup: BeautifulSoup) -> str:
-    contents = jpdb_soup.find(class_="primary-spelling").find("ruby").contents
+def extract_spelling(section: Tag) -> str:
+    contents = section.find("ruby").contents
 
     spelling = ""
     for s in contents:
@@ -54,25 +106,18 @@ def extract_spelling(jpdb_soup: BeautifulSoup) -> str:
     return spelling
 
 
-def extract_pitch(jpdb_soup: BeautifulSoup, expression: str) -> str:
-    reading = (
-        jpdb_soup.find("meta", attrs={"name": "description"})
-        .attrs["content"]
-        .split(" ")[4][1:-1]
-    )
+def extract_pitch(description: Tag, expression: str) -> str:
+    reading = description.attrs["content"].split(" ")[4][1:-1]
     pitch_html = get_pitch_html(expression, reading, PITCH_DICTIONARY)
     return pitch_html if pitch_html else ""
 
 
-def extract_frequency(jpdb_soup: BeautifulSoup) -> int:
-    frequency = jpdb_soup.find(class_="tag tooltip")
-    return frequency.text.split(" ")[-1] if frequency else "100000"
+def extract_frequency(section: Optional[Tag]) -> int:
+    return section.text.split(" ")[-1] if section else "100000"
 
 
-def extract_meanings(jpdb_soup: BeautifulSoup) -> str:
-    meanings_list = jpdb_soup.find(class_="subsection-meanings").find_all(
-        class_="description"
-    )
+def extract_meanings(section: Tag) -> str:
+    meanings_list = section.find_all(class_="description")
 
     meanings = ""
     for m in meanings_list:
@@ -81,12 +126,11 @@ def extract_meanings(jpdb_soup: BeautifulSoup) -> str:
     return meanings
 
 
-def extract_examples(jpdb_soup: BeautifulSoup) -> str:
-    examples_section = jpdb_soup.find(class_="subsection-examples")
-    if not examples_section:
+def extract_examples(section: Optional[Tag]) -> str:
+    if not section:
         return ""
 
-    examples_list = examples_section.find_all(class_="used-in")
+    examples_list = section.find_all(class_="used-in")
     jp = [e.find(class_="jp").text for e in examples_list]
     en = [e.find(class_="en").text for e in examples_list]
     examples_list = list(zip(jp, en))
@@ -114,19 +158,26 @@ class JPDB_Note:
     note_id: str
 
     @classmethod
-    def from_jpdb(cls, url: Url):
-        jpdb_soup = load_url(url)
+    def from_jpdb(cls, url: Url, limiter: Optional[TokenBucket] = None):
+        jpdb_soup = load_url(url, limiter=limiter)
         if jpdb_soup is None:
             return None
+        return cls.from_soup(jpdb_soup, url)
 
-        expression = jpdb_soup.find("title").text.split(" ")[0]
-        part_of_speech = extract_part_of_speech(jpdb_soup)
-        spelling = extract_spelling(jpdb_soup)
-        frequency = extract_frequency(jpdb_soup)
-        pitch = extract_pitch(jpdb_soup, expression)
-        meanings = extract_meanings(jpdb_soup)
-        examples = extract_examples(jpdb_soup)
-        note_id = extract_id(url)
+    @classmethod
+    def from_soup(cls, jpdb_soup: BeautifulSoup, url: Url):
+        with instrumentation.span("jpdb.extract"):
+            sections = find_sections(jpdb_soup)
+
+            expression = sections["title"].text.split(" ")[0]
+            part_of_speech = extract_part_of_speech(sections["part-of-speech"])
+            spelling = extract_spelling(sections["primary-spelling"])
+            frequency = extract_frequency(sections.get("tag tooltip"))
+            meanings = extract_meanings(sections["subsection-meanings"])
+            examples = extract_examples(sections.get("subsection-examples"))
+            note_id = extract_id(url)
+
+        pitch = extract_pitch(sections["description"], expression)
 
         return JPDB_Note(
             expression=expression,
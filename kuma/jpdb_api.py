@@ -1,18 +1,31 @@
-from copy import copy
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 import json
-import requests
+import logging
 from pathlib import Path
-from typing import Optional
+import time
+from typing import Iterator, List, Optional
+
+import requests
 
 import aqt
 from aqt.utils import showInfo
 import aqt.editor
 
-from .anki import KumaAnki, is_in_deck
-from .jpdb import JPDB_Note, get_pitch_html, PITCH_DICTIONARY
+from . import client
+from . import instrumentation
+from . import profiling
+from . import sync
+from .anki import KumaAnki, DeckIdIndex, slot_notes_on_frequency
+from .jpdb import JPDB, JPDB_Note, PITCH_DICTIONARY
+from .part_of_speech import beautify_partofspeech
+from .pitch import render_many
+from .pipeline import Pipeline
 from .utils.pyqt6 import LineEditRadioButton
 
+logger = logging.getLogger(__name__)
+
 
 @dataclass
 class Note:
@@ -24,191 +37,127 @@ class Note:
     note_id: str
 
 
+class JpdbAPIError(Exception):
+    pass
+
+
 class JpdbAPI:
-    def __init__(self, api_key: str):
+    api_path = "/api/v1"
+
+    # lookups are sent in chunks over a small pool of workers
+    chunk_size = 1000
+    max_workers = 4
+
+    note_fields = [
+        "spelling",
+        "reading",
+        "frequency_rank",
+        "meanings",
+        "part_of_speech",
+    ]
+
+    def __init__(
+        self,
+        api_key: str,
+        *,
+        chunk_size: Optional[int] = None,
+        max_workers: Optional[int] = None,
+    ):
         self.token = api_key
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        if max_workers is not None:
+            self.max_workers = max_workers
 
-    def vocabulary_list(self, deck_id: int):
-        url = "https://jpdb.io/api/v1/deck/list-vocabulary"
+    @property
+    def base_url(self) -> str:
+        return JPDB.base_url + self.api_path
 
-        payload = {"id": deck_id, "fetch_occurences": False}
-        headers = {
+    def headers(self) -> dict:
+        return {
             "Content-Type": "application/json",
             "Accept": "application/json",
             "Authorization": f"Bearer {self.token}",
         }
-        response = requests.post(url, json=payload, headers=headers)
+
+    def vocabulary_ids(self, deck_id: int) -> list:
+        url = self.base_url + "/deck/list-vocabulary"
+
+        payload = {"id": deck_id, "fetch_occurences": False}
+        with instrumentation.span("api.list"):
+            response = client.post(url, json=payload, headers=self.headers())
 
         if response.status_code == 200:
-            return self.notes(response.json()["vocabulary"])
+            return response.json()["vocabulary"]
 
         if response.status_code == 400:
-            showInfo("Something went wrong. Please check the Deck Id")
-            return []
+            raise JpdbAPIError("Something went wrong. Please check the Deck Id")
 
         if response.status_code == 403:
-            showInfo("Please check your API key")
-            return []
-
-        showInfo("Something unexpected went wrong.")
-        return []
-
-    def notes(self, note_ids) -> dict:
-        url = "https://jpdb.io/api/v1/lookup-vocabulary"
-
-        payload = {
-            "list": note_ids,
-            "fields": [
-                "spelling",
-                "reading",
-                "frequency_rank",
-                "meanings",
-                "part_of_speech",
-            ],
-        }
-        headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-            "Authorization": f"Bearer {self.token}",
-        }
+            raise JpdbAPIError("Please check your API key")
 
-        response = requests.post(url, json=payload, headers=headers)
-        notes_info = response.json()["vocabulary_info"]
+        raise JpdbAPIError("Something unexpected went wrong.")
 
-        notes_info = [info + [str(nid[0])] for (info, nid) in zip(notes_info, note_ids)]
-        return notes_info
-
-
-def beautify_partofspeech(pos) -> str:
-    partofspeech_eq = {
-        "n": "Noun",
-        "pn": "Pronoun",
-        "prt": "Particle",
-        "int": "Interjection",
-        "conj": "Conjunction",
-        "pref": "Prefix",
-        "suf": "Suffix",
-        "cop": "Copula",
-        "ctr": "Counter",
-        "adj-i": "Adjective (い)",
-        "adj-no": "Adjective (の)",
-        "adj-na": "Adjective (な)",
-        "adj-ku": "Adjective (く)",
-        "adj-nari": "Adjective (なり)",
-        "adj-pn": "Pre-noun adjective",
-        "adv": "Adverb",
-        "exp": "Expression",
-        "aux": "Auxiliary",
-        "name": "Name",
-        "name-surname": "",
-        "name-place": "",
-        "name-male": "",
-        "name-fem": "",
-        "name-given": "",
-        "num": "Numeric",
-        "aux-adj": "Aux. adjective",
-        "aux-v": "Auxiliary Verb",
-        "vs": "Verb (する)",
-        "vi": "intransitive",
-        "vt": "transitive",
-        "va": "Verb archaic",
-        "v1": "1-dan",
-        "v1-s": "1-dan",
-        "v2": "2-dan",
-        "vk": "irregular",
-        "vs-c": "Verb (す)",
-        "v4": {
-            "": "",
-            "v4u": "4-dan, う",
-            "v4u-s": "4-dan, う",
-            "v4k": "4-dan, く",
-            "v4k-s": "4-dan, く",
-            "v4g": "4-dan, ぐ",
-            "v4g-s": "4-dan, ぐ",
-            "v4s": "4-dan, す",
-            "v4s-s": "4-dan, す",
-            "v4t": "4-dan, つ",
-            "v4t-s": "4-dan, つ",
-            "v4n": "4-dan, ぬ",
-            "v4n-s": "4-dan, ぬ",
-            "v4b": "4-dan, ぶ",
-            "v4b-s": "4-dan, ぶ",
-            "v4m": "4-dan, む",
-            "v4m-s": "4-dan, む",
-            "v4r": "4-dan, る",
-            "v4r-s": "4-dan, る",
-            "v4r-i": "irregular",
-            "v4aru": "4-dan",
-        },
-        "v5": {
-            "": "",
-            "v5u": "5-dan, う",
-            "v5u-s": "5-dan, う",
-            "v5k": "5-dan, く",
-            "v5k-s": "5-dan, く",
-            "v5g": "5-dan, ぐ",
-            "v5g-s": "5-dan, ぐ",
-            "v5s": "5-dan, す",
-            "v5s-s": "5-dan, す",
-            "v5t": "5-dan, つ",
-            "v5t-s": "5-dan, つ",
-            "v5n": "5-dan, ぬ",
-            "v5n-s": "5-dan, ぬ",
-            "v5b": "5-dan, ぶ",
-            "v5b-s": "5-dan, ぶ",
-            "v5m": "5-dan, む",
-            "v5m-s": "5-dan, む",
-            "v5r": "5-dan, る",
-            "v5r-s": "5-dan, る",
-            "v5r-i": "irregular",
-            "v5aru": "5-dan",
-        },
-    }
+    def vocabulary_list(self, deck_id: int):
+        return self.notes(self.vocabulary_ids(deck_id))
+
+    def notes(self, note_ids, fields: Optional[List[str]] = None) -> list:
+        return [info for chunk in self.iter_notes(note_ids, fields) for info in chunk]
+
+    def iter_notes(
+        self, note_ids, fields: Optional[List[str]] = None
+    ) -> Iterator[list]:
+        """Yields the notes information chunk by chunk, in order.
+
+        Only `fields` are looked up when given, `note_fields` otherwise, and
+        the id of the note is appended to them. Chunks are looked up
+        concurrently, a bounded number of them ahead of the consumer. Each
+        chunk is retried on its own when it fails.
+        """
+        fields = fields if fields is not None else self.note_fields
+        chunks = [
+            note_ids[i : i + self.chunk_size]
+            for i in range(0, len(note_ids), self.chunk_size)
+        ]
 
-    result = ""
-    t_or_i = ", "
-
-    def add_pos(res, pos):
-        if len(res) > 0:
-            res += ", "
-        res += pos
-        return res
-
-    _pos = copy(pos)
-    while len(_pos) > 0:
-        p = _pos.pop(0)
-
-        if p in ["vi", "vt"]:
-            t_or_i += partofspeech_eq[p]
-            continue
-
-        if p == "v4" or p == "v5":
-            _p = _pos.pop(0)
-            try:
-                result = add_pos(result, f"Verb ({partofspeech_eq[p][_p]}{t_or_i})")
-            except KeyError:
-                print(
-                    f"part of speech {_p} is not implemented, please fill an issue on GitHub."
-                )
-            continue
-
-        if p == "v1" or p == "v2":
-            add_pos(result, f"Verb ({partofspeech_eq[p]}{t_or_i})")
-            continue
-
-        if p == "vk":
-            result = add_pos(result, f"Verb ({partofspeech_eq['vk']}{t_or_i})")
-            continue
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = deque()
+            chunks_iter = iter(chunks)
+
+            def submit_next():
+                chunk = next(chunks_iter, None)
+                if chunk is not None:
+                    pending.append(pool.submit(self._lookup_chunk, chunk, fields))
+
+            for _ in range(2 * self.max_workers):
+                submit_next()
 
+            while pending:
+                notes_info = pending.popleft().result()
+                submit_next()
+                yield notes_info
+
+    @instrumentation.timed("api.lookup")
+    def _lookup_chunk(self, note_ids, fields: List[str]) -> list:
+        url = self.base_url + "/lookup-vocabulary"
+        payload = {"list": note_ids, "fields": fields}
+
+        # 429 and 5xx are already retried with backoff by the session
         try:
-            result = add_pos(result, partofspeech_eq[p])
-        except:
-            print(
-                f"part of speech {p} is not implemented, please fill an issue on GitHub."
+            response = client.post(url, json=payload, headers=self.headers())
+        except requests.RequestException as e:
+            raise JpdbAPIError(f"Lookup of {len(note_ids)} notes failed: {e}")
+
+        if response.status_code == 403:
+            raise JpdbAPIError("Please check your API key")
+        if response.status_code != 200:
+            raise JpdbAPIError(
+                f"Lookup of {len(note_ids)} notes failed: "
+                f"status code {response.status_code}"
             )
-            continue
 
-    return result
+        notes_info = response.json()["vocabulary_info"]
+        return [info + [str(nid[0])] for (info, nid) in zip(notes_info, note_ids)]
 
 
 def beautify_meaning(meaning) -> str:
@@ -218,59 +167,234 @@ def beautify_meaning(meaning) -> str:
     return result
 
 
+def to_note(notes_info: list) -> Note:
+    return Note(**{k: v for (k, v) in zip(Note.__dataclass_fields__, notes_info)})
+
+
 def to_jpdb_note(note: Note):
-    pitch = get_pitch_html(note.spelling, note.reading, PITCH_DICTIONARY)
-    if pitch is None:
-        pitch = ""
-    return JPDB_Note(
-        expression=note.spelling,
-        part_of_speech=beautify_partofspeech(note.part_of_speech),
-        spelling=note.reading,
-        pitch=pitch,
-        frequency=str(note.frequency_rank),
-        meanings=beautify_meaning(note.meanings),
-        examples="",  # not provided by the API
-        note_id=note.note_id,
+    return to_jpdb_notes([note])[0]
+
+
+def to_jpdb_notes(notes: list[Note]) -> list[JPDB_Note]:
+    """Batch version of `to_jpdb_note`, rendering all the pitches at once."""
+    pitches = render_many(
+        ((note.spelling, note.reading) for note in notes), PITCH_DICTIONARY
     )
+    return [
+        JPDB_Note(
+            expression=note.spelling,
+            part_of_speech=beautify_partofspeech(note.part_of_speech),
+            spelling=note.reading,
+            pitch=pitch if pitch is not None else "",
+            frequency=str(note.frequency_rank),
+            meanings=beautify_meaning(note.meanings),
+            examples="",  # not provided by the API
+            note_id=note.note_id,
+        )
+        for note, pitch in zip(notes, pitches)
+    ]
 
 
 class VLAPIGenerationThread(aqt.QThread):
+    """Runs the fetch -> convert -> insert pipeline of the API import.
+
+    Lookups and conversions run in worker threads; only the insertion runs
+    in this thread, and only signals are sent back to the interface.
+
+    With `sync`, the notes of the deck are also compared to the snapshot of
+    the last sync: the changed ones are updated, and with `remove` the ones
+    no longer in the JPDB deck are removed.
+    """
+
     finished = aqt.pyqtSignal()
+    started_generation = aqt.pyqtSignal(int)
     generated = aqt.pyqtSignal(int)
-
-    def __init__(self, notes: list[JPDB_Note], current_deck: str):
+    throughput = aqt.pyqtSignal(str)
+
+    def __init__(
+        self,
+        api: JpdbAPI,
+        deck_id: int,
+        current_deck: str,
+        config: Optional[dict] = None,
+        *,
+        sync: bool = False,
+        remove: bool = False,
+    ):
         super().__init__()
-        self.notes = notes
+        self.api = api
+        self.deck_id = deck_id
         self.current_deck = current_deck
+        self.config = config if config is not None else {}
+        self.sync = sync
+        self.remove = remove and sync
+
+        self.n_added = 0
+        self.n_updated = 0
+        self.n_removed = 0
+        self.notes_per_sec = 0.0
+        self.error = None
+        self.recording = instrumentation.Recording(
+            "api-generation", self.config.get("instrumentation", False)
+        )
+        self.profiler = profiling.Profiler(
+            "api-generation", self.config.get("profile", False)
+        )
 
     def run(self):
-        for i, n in enumerate(self.notes):
-            self.generated.emit(i)
+        start_time = time.perf_counter()
 
-            if is_in_deck(self.current_deck, n.note_id):
-                continue
+        try:
+            with self.profiler, self.recording:
+                self.generate()
+        except JpdbAPIError as e:
+            self.error = str(e)
+        except Exception as e:
+            # a failure must still end the generation in the interface
+            logger.exception("API generation failed")
+            self.error = f"Generation failed: {e}"
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self.notes_per_sec = self.n_added / elapsed if elapsed > 0 else 0.0
+            self.finished.emit()
+
+    def generate(self):
+        note_ids = self.api.vocabulary_ids(self.deck_id)
+        self.started_generation.emit(len(note_ids))
+
+        index = DeckIdIndex(self.current_deck)
+        undo_entry = KumaAnki.add_undo_entry()
+
+        if self.sync:
+            snapshot = sync.Snapshot(
+                KumaAnki.deck(self.current_deck)["id"], f"api-{self.deck_id}"
+            ).load()
+            delta = sync.compute_delta(snapshot, (nid[0] for nid in note_ids), index)
+            hashes = {}
+        else:
+            delta = None
+
+        # only the notes missing from the deck are looked up in full
+        to_add = [nid for nid in note_ids if str(nid[0]) not in index]
+        kept = [nid for nid in note_ids if str(nid[0]) in index]
+        n_done = len(note_ids) - len(to_add)
+        self.generated.emit(n_done)
+
+        def convert(notes_info: list) -> list[JPDB_Note]:
+            notes = [to_note(info) for info in notes_info]
+            if delta is not None:
+                for note in notes:
+                    hashes[note.note_id] = sync.content_hash(
+                        note.frequency_rank, note.meanings
+                    )
+            return to_jpdb_notes(notes)
+
+        def insert(notes: list[JPDB_Note]):
+            nonlocal n_done
+            to_insert = []
+            for n in notes:
+                if n.note_id in index:
+                    continue
+                index.add(n.note_id)
+                to_insert.append(n)
+
+            added = KumaAnki.add_notes(
+                to_insert, self.current_deck, undo_entry=undo_entry
+            )
+            slot_notes_on_frequency(self.current_deck, added, undo_entry)
+            self.n_added += len(added)
+            n_done += len(notes)
+            self.generated.emit(n_done)
+
+        if len(to_add) > 0:
+            pipeline = Pipeline(
+                self.api.iter_notes(to_add),
+                [("convert", convert), ("insert", insert)],
+                on_progress=lambda _: self.throughput.emit(pipeline.summary()),
+            )
+            pipeline.run()
+
+        if delta is not None:
+            self.sync_deck(kept, snapshot, delta, hashes, undo_entry)
+
+    def sync_deck(
+        self,
+        kept: list,
+        snapshot: sync.Snapshot,
+        delta: sync.Delta,
+        hashes: dict,
+        undo_entry: int,
+    ) -> None:
+        """Updates the changed notes, removes the deleted ones, and saves the
+        new snapshot.
+
+        `kept` are the vocabulary ids of the notes that were already in the
+        deck, and `hashes` the content hashes of the notes just added. On the
+        first sync of the deck the kept notes are left as they are, only their
+        hashes are saved.
+        """
+        # only the fields that can change are looked up for the other notes
+        kept_info = {}
+        for frequency_rank, meanings, note_id in self.api.notes(
+            kept, ["frequency_rank", "meanings"]
+        ):
+            hashes[note_id] = sync.content_hash(frequency_rank, meanings)
+            kept_info[note_id] = (frequency_rank, meanings)
+
+        changed_notes = [
+            JPDB_Note(
+                expression="",
+                part_of_speech="",
+                spelling="",
+                pitch="",
+                frequency=str(kept_info[note_id][0]),
+                meanings=beautify_meaning(kept_info[note_id][1]),
+                examples="",
+                note_id=note_id,
+            )
+            for note_id in sync.changed(snapshot, hashes)
+            if note_id in kept_info
+        ]
+        updated = KumaAnki.update_notes(
+            changed_notes,
+            self.current_deck,
+            fields=["Frequency", "Meanings"],
+            undo_entry=undo_entry,
+        )
+        self.n_updated = len(updated)
 
-            try:
-                KumaAnki.add_note(n, self.current_deck)
-            except:
-                continue
+        if self.remove:
+            nids = KumaAnki.notes_by_id(self.current_deck)
+            self.n_removed = KumaAnki.remove_notes(
+                [nids[note_id] for note_id in delta.removed if note_id in nids],
+                undo_entry,
+            )
+        else:
+            # kept in the snapshot, to be removed by a later sync
+            for note_id in delta.removed:
+                hashes[note_id] = snapshot.hashes[note_id]
 
-        self.finished.emit()
+        snapshot.save(hashes)
 
 
 class JPDB_API_VocabListWidget(aqt.QWidget):
-    def __init__(self, parent: aqt.QWidget, *, previous_query: Optional[str] = None):
+    def __init__(
+        self,
+        parent: aqt.QWidget,
+        *,
+        previous_query: Optional[str] = None,
+        decks_list: Optional[List[str]] = None,
+    ):
         super().__init__(parent)
 
         self.path_to_config = Path(__file__).resolve().parent / "config" / "api.json"
-        if not self.path_to_config.exists():
-            config = {"token": ""}
-        else:
+        self.config = {"token": "", "instrumentation": False, "profile": False}
+        if self.path_to_config.exists():
             with self.path_to_config.open("r") as f:
-                config = json.load(f)
+                self.config.update(json.load(f))
 
         self.token_lineEdit = LineEditRadioButton(
-            self, config["token"], False, "Check to save API key."
+            self, self.config["token"], False, "Check to save API key."
         )
         self.deckId_lineEdit = aqt.QLineEdit(self)
 
@@ -280,13 +404,24 @@ class JPDB_API_VocabListWidget(aqt.QWidget):
         self.deck_label = aqt.QLabel("Select a deck", self)
         self.select_deck_comboBox = aqt.QComboBox(self)
 
+        self.sync_checkBox = aqt.QCheckBox("Update the notes changed on JPDB", self)
+        self.sync_checkBox.setToolTip(
+            "Only fetches what changed since the last sync of this deck."
+        )
+        self.remove_checkBox = aqt.QCheckBox(
+            "Remove the notes no longer in the JPDB deck", self
+        )
+        self.remove_checkBox.setEnabled(False)
+
         self.generate_button = aqt.QPushButton("Generate", self)
 
         self.prog_bar = aqt.QProgressBar(self)
         self.prog_bar.hide()
 
         self.can_generate = True
-        self.decks_list = KumaAnki.decks().all_names(force_default=False)
+        self.decks_list = (
+            decks_list if decks_list is not None else KumaAnki.deck_names()
+        )
 
         self._layout = aqt.QFormLayout(self)
         self.layout_init()
@@ -297,11 +432,14 @@ class JPDB_API_VocabListWidget(aqt.QWidget):
         self._layout.addRow("Enter Deck Id: ", self.deckId_lineEdit)
         self._layout.addWidget(self.deck_label)
         self._layout.addWidget(self.select_deck_comboBox)
+        self._layout.addWidget(self.sync_checkBox)
+        self._layout.addWidget(self.remove_checkBox)
         self._layout.addWidget(self.generate_button)
         self._layout.addWidget(self.prog_bar)
 
     def widget_init(self):
         self.select_deck_comboBox.addItems(self.decks_list)
+        self.sync_checkBox.toggled.connect(self.remove_checkBox.setEnabled)
         self.generate_button.pressed.connect(self.generate_or_update)
 
     def generate_or_update(self) -> None:
@@ -312,38 +450,62 @@ class JPDB_API_VocabListWidget(aqt.QWidget):
         token = self.token_lineEdit.text()
 
         if self.token_lineEdit.isChecked():
+            # the other settings of the file are kept
+            self.config["token"] = token
             with self.path_to_config.open("w") as f:
-                json.dump({"token": self.token_lineEdit.text()}, f)
+                json.dump(self.config, f, indent=4)
 
         deck_id = self.deckId_lineEdit.text()
         current_deck = self.select_deck_comboBox.currentText()
         api = JpdbAPI(token)
 
-        notes = api.vocabulary_list(int(deck_id))
-        if len(notes) == 0:
-            self.can_generate = True
-            self.prog_bar.hide()
-            return
-
-        notes = [
-            to_jpdb_note(Note(**{k: v for (k, v) in zip(Note.__dataclass_fields__, n)}))
-            for n in notes
-        ]
-
         self.prog_bar.show()
-        self.prog_bar.setRange(0, len(notes))
-        self.prog_bar.setValue(0)
-
-        self.generation_worker = VLAPIGenerationThread(notes, current_deck)
+        self.prog_bar.setRange(0, 0)  # busy until the list size is known
+        self.prog_bar.setFormat("%v/%m")
+
+        self.generation_worker = VLAPIGenerationThread(
+            api,
+            int(deck_id),
+            current_deck,
+            self.config,
+            sync=self.sync_checkBox.isChecked(),
+            remove=self.remove_checkBox.isChecked(),
+        )
+        self.generation_worker.started_generation.connect(self._on_generation_started)
         self.generation_worker.generated.connect(self._on_generating)
+        self.generation_worker.throughput.connect(self._on_throughput)
         self.generation_worker.finished.connect(self._on_generation_finished)
         self.generation_worker.finished.connect(self.generation_worker.quit)
         self.generation_worker.start()
 
+    def _on_generation_started(self, n_notes):
+        self.prog_bar.setRange(0, n_notes)
+        self.prog_bar.setValue(0)
+
     def _on_generating(self, i):
         self.prog_bar.setValue(i)
 
+    def _on_throughput(self, summary):
+        self.prog_bar.setFormat("%v/%m  (" + summary + ")")
+
     def _on_generation_finished(self):
         self.can_generate = True
         self.prog_bar.hide()
-        showInfo("Generation Finished!")
+        if self.generation_worker.error is not None:
+            showInfo(
+                self.generation_worker.error + "\n"
+                f"{self.generation_worker.n_added} notes were added before."
+            )
+            return
+        message = (
+            "Generation Finished!\n"
+            f"{self.generation_worker.n_added} notes added "
+            f"({self.generation_worker.notes_per_sec:.1f} notes/sec)."
+        )
+        if self.generation_worker.sync:
+            message += (
+                f"\n{self.generation_worker.n_updated} notes updated, "
+                f"{self.generation_worker.n_removed} notes removed."
+            )
+        showInfo(message)
+        instrumentation.show_report(self.generation_worker.recording)
@@ -0,0 +1,26 @@
+"""Segmentation of kana readings into morae."""
+
+from functools import lru_cache
+import re
+from typing import Tuple
+
+# small kana merged with the kana before them; っ, ッ and ー are morae of their own
+COMBINERS = "ゃゅょぁぃぅぇぉゎャュョァィゥェォヮ"
+
+MORA_PATTERN = re.compile(f".[{COMBINERS}]?", re.DOTALL)
+
+MORA_CACHE_SIZE = 65536
+
+
+def split_mora(reading: str) -> Tuple[str, ...]:
+    """Splits a kana reading into morae.
+
+    Example:
+        in:  'しゅんかしゅうとう'
+        out: ('しゅ', 'ん', 'か', 'しゅ', 'う', 'と', 'う')
+    """
+    return tuple(MORA_PATTERN.findall(reading))
+
+
+# readings are segmented once and the tuple is shared by the pitch pipeline
+to_mora = lru_cache(maxsize=MORA_CACHE_SIZE)(split_mora)
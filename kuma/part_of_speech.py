@@ -0,0 +1,159 @@
+"""Formatting of JPDB parts of speech."""
+
+from functools import lru_cache
+import logging
+from types import MappingProxyType
+from typing import Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# frozen, including the conjugation classes of the v4 and v5 verbs
+PART_OF_SPEECH = MappingProxyType(
+    {
+        "n": "Noun",
+        "pn": "Pronoun",
+        "prt": "Particle",
+        "int": "Interjection",
+        "conj": "Conjunction",
+        "pref": "Prefix",
+        "suf": "Suffix",
+        "cop": "Copula",
+        "ctr": "Counter",
+        "adj-i": "Adjective (い)",
+        "adj-no": "Adjective (の)",
+        "adj-na": "Adjective (な)",
+        "adj-ku": "Adjective (く)",
+        "adj-nari": "Adjective (なり)",
+        "adj-pn": "Pre-noun adjective",
+        "adv": "Adverb",
+        "exp": "Expression",
+        "aux": "Auxiliary",
+        "name": "Name",
+        "name-surname": "",
+        "name-place": "",
+        "name-male": "",
+        "name-fem": "",
+        "name-given": "",
+        "num": "Numeric",
+        "aux-adj": "Aux. adjective",
+        "aux-v": "Auxiliary Verb",
+        "vs": "Verb (する)",
+        "vi": "intransitive",
+        "vt": "transitive",
+        "va": "Verb archaic",
+        "v1": "1-dan",
+        "v1-s": "1-dan",
+        "v2": "2-dan",
+        "vk": "irregular",
+        "vs-c": "Verb (す)",
+        "v4": MappingProxyType(
+            {
+                "": "",
+                "v4u": "4-dan, う",
+                "v4u-s": "4-dan, う",
+                "v4k": "4-dan, く",
+                "v4k-s": "4-dan, く",
+                "v4g": "4-dan, ぐ",
+                "v4g-s": "4-dan, ぐ",
+                "v4s": "4-dan, す",
+                "v4s-s": "4-dan, す",
+                "v4t": "4-dan, つ",
+                "v4t-s": "4-dan, つ",
+                "v4n": "4-dan, ぬ",
+                "v4n-s": "4-dan, ぬ",
+                "v4b": "4-dan, ぶ",
+                "v4b-s": "4-dan, ぶ",
+                "v4m": "4-dan, む",
+                "v4m-s": "4-dan, む",
+                "v4r": "4-dan, る",
+                "v4r-s": "4-dan, る",
+                "v4r-i": "irregular",
+                "v4aru": "4-dan",
+            }
+        ),
+        "v5": MappingProxyType(
+            {
+                "": "",
+                "v5u": "5-dan, う",
+                "v5u-s": "5-dan, う",
+                "v5k": "5-dan, く",
+                "v5k-s": "5-dan, く",
+                "v5g": "5-dan, ぐ",
+                "v5g-s": "5-dan, ぐ",
+                "v5s": "5-dan, す",
+                "v5s-s": "5-dan, す",
+                "v5t": "5-dan, つ",
+                "v5t-s": "5-dan, つ",
+                "v5n": "5-dan, ぬ",
+                "v5n-s": "5-dan, ぬ",
+                "v5b": "5-dan, ぶ",
+                "v5b-s": "5-dan, ぶ",
+                "v5m": "5-dan, む",
+                "v5m-s": "5-dan, む",
+                "v5r": "5-dan, る",
+                "v5r-s": "5-dan, る",
+                "v5r-i": "irregular",
+                "v5aru": "5-dan",
+            }
+        ),
+    }
+)
+
+
+def beautify_partofspeech(pos: Sequence[str]) -> str:
+    """Formats a JPDB part of speech list, eg. ['v5r', 'vt']."""
+    return _beautify_partofspeech(tuple(pos))
+
+
+@lru_cache(maxsize=4096)
+def _beautify_partofspeech(pos: Tuple[str, ...]) -> str:
+    # decks only have a few hundred distinct part of speech combinations
+    result = ""
+    t_or_i = ", "
+
+    def add_pos(res, pos):
+        if len(res) > 0:
+            res += ", "
+        res += pos
+        return res
+
+    i = 0
+    while i < len(pos):
+        p = pos[i]
+        i += 1
+
+        if p in ("vi", "vt"):
+            t_or_i += PART_OF_SPEECH[p]
+            continue
+
+        if p == "v4" or p == "v5":
+            _p = pos[i] if i < len(pos) else ""
+            i += 1
+            try:
+                conjugation = PART_OF_SPEECH[p][_p]
+            except KeyError:
+                logger.warning(
+                    "part of speech %s is not implemented, please fill an issue on GitHub.",
+                    _p,
+                )
+                continue
+            if conjugation:
+                result = add_pos(result, f"Verb ({conjugation}{t_or_i})")
+            else:
+                result = add_pos(result, "Verb")
+            continue
+
+        if p in ("v1", "v2", "vk"):
+            result = add_pos(result, f"Verb ({PART_OF_SPEECH[p]}{t_or_i})")
+            continue
+
+        try:
+            result = add_pos(result, PART_OF_SPEECH[p])
+        except KeyError:
+            logger.warning(
+                "part of speech %s is not implemented, please fill an issue on GitHub.",
+                p,
+            )
+            continue
+
+    return result
@@ -0,0 +1,159 @@
+"""Staged pipeline with bounded queues between stages."""
+
+from dataclasses import dataclass
+import queue
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, Tuple
+
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    busy: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Items per second of busy time."""
+        return self.items / self.busy if self.busy > 0 else 0.0
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _size(item) -> int:
+    return len(item) if isinstance(item, (list, tuple)) else 1
+
+
+class Pipeline:
+    """Runs `source -> stages[0] -> ... -> stages[-1]`.
+
+    The source and every stage but the last run in their own worker thread,
+    connected by queues of at most `maxsize` items. The last stage runs in
+    the thread calling `run`, so it can safely write to the collection.
+    Items are usually chunks (lists); stats count their elements.
+    """
+
+    def __init__(
+        self,
+        source: Iterable,
+        stages: List[Tuple[str, Callable]],
+        *,
+        source_name: str = "fetch",
+        maxsize: int = 4,
+        on_progress: Optional[Callable[[List[StageStats]], None]] = None,
+    ):
+        self.source = source
+        self.stages = stages
+        self.maxsize = maxsize
+        self.on_progress = on_progress
+
+        self.stats = [StageStats(source_name)] + [
+            StageStats(name) for name, _ in stages
+        ]
+        self._stop = threading.Event()
+
+    def summary(self) -> str:
+        return " | ".join(f"{s.name} {s.throughput:.0f}/s" for s in self.stats)
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _DONE
+
+    def _run_source(self, out_q: queue.Queue) -> None:
+        stats = self.stats[0]
+        items = iter(self.source)
+        try:
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                item = next(items, _DONE)
+                if item is _DONE:
+                    break
+                stats.busy += time.perf_counter() - start
+                stats.items += _size(item)
+                if not self._put(out_q, item):
+                    return
+        except BaseException as e:
+            self._put(out_q, _Failure(e))
+            return
+        finally:
+            # lets generator sources release their resources
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+        self._put(out_q, _DONE)
+
+    def _run_stage(self, i: int, in_q: queue.Queue, out_q: queue.Queue) -> None:
+        _, fn = self.stages[i]
+        stats = self.stats[i + 1]
+        while True:
+            item = self._get(in_q)
+            if item is _DONE or isinstance(item, _Failure):
+                self._put(out_q, item)
+                return
+            try:
+                start = time.perf_counter()
+                result = fn(item)
+                stats.busy += time.perf_counter() - start
+                stats.items += _size(item)
+            except BaseException as e:
+                self._put(out_q, _Failure(e))
+                return
+            if not self._put(out_q, result):
+                return
+
+    def run(self) -> None:
+        queues = [queue.Queue(self.maxsize) for _ in self.stages]
+        workers = [
+            threading.Thread(target=self._run_source, args=(queues[0],), daemon=True)
+        ]
+        for i in range(len(self.stages) - 1):
+            workers.append(
+                threading.Thread(
+                    target=self._run_stage,
+                    args=(i, queues[i], queues[i + 1]),
+                    daemon=True,
+                )
+            )
+        for w in workers:
+            w.start()
+
+        _, sink = self.stages[-1]
+        stats = self.stats[-1]
+        try:
+            while True:
+                item = self._get(queues[-1])
+                if item is _DONE:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.error
+
+                start = time.perf_counter()
+                sink(item)
+                stats.busy += time.perf_counter() - start
+                stats.items += _size(item)
+
+                if self.on_progress is not None:
+                    self.on_progress(self.stats)
+        finally:
+            self._stop.set()
+            for w in workers:
+                w.join()
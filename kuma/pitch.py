@@ -1,5 +1,14 @@
 """Pitch related functions."""
 
+from functools import lru_cache
+import logging
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from . import instrumentation
+from .mora import to_mora
+
+logger = logging.getLogger(__name__)
+
 # region Generate SVG from https://github.com/IllDepence/SVG_pitch
 
 
@@ -15,72 +24,52 @@ def hira_to_mora(hira: str) -> list[str]:
         in:  'しゅんかしゅうとう'
         out: ['しゅ', 'ん', 'か', 'しゅ', 'う', 'と', 'う']
     """
-
-    mora_arr = []
-    combiners = [
-        "ゃ",
-        "ゅ",
-        "ょ",
-        "ぁ",
-        "ぃ",
-        "ぅ",
-        "ぇ",
-        "ぉ",
-        "ャ",
-        "ュ",
-        "ョ",
-        "ァ",
-        "ィ",
-        "ゥ",
-        "ェ",
-        "ォ",
-    ]
-
-    i = 0
-    while i < len(hira):
-        if i + 1 < len(hira) and hira[i + 1] in combiners:
-            mora_arr.append("{}{}".format(hira[i], hira[i + 1]))
-            i += 2
-        else:
-            mora_arr.append(hira[i])
-            i += 1
-    return mora_arr
+    return list(to_mora(hira))
+
+
+# precompiled fragments, formatted with the coordinates of each element
+_SVG_HEAD = (
+    '<svg class="pitch" width="{0}px" height="75px" viewBox="0 0 {0} 75">'
+    '<rect width="{0}px" height="75px" style="fill:rgb(255,255,255);opacity:1">'
+    "</rect>"
+)
+_SVG_TAIL = "</svg>"
+_CIRCLE = '<circle r="5" cx="{0}" cy="{1}" style="opacity:1;fill:#000;" />'
+_CIRCLE_OPEN = _CIRCLE + (
+    '<circle r="3.25" cx="{0}" cy="{1}" style="opacity:1;fill:#fff;"/>'
+)
+_TEXT = (
+    '<text x="{}" y="67.5" style="font-size:20px;font-family:sans-serif;'
+    'fill:#000;">{}</text>'
+)
+_TEXT_SMALL = (
+    '<text x="{}" y="67.5" style="font-size:14px;font-family:sans-serif;'
+    'fill:#000;">{}</text>'
+)
+_PATH = '<path d="m {},{} {},{}" style="fill:none;stroke:#000;stroke-width:1.5;" />'
+
+_ACCENT_Y = {"H": 5, "h": 5, "1": 5, "2": 5, "L": 30, "l": 30, "0": 30}
+
+STEP_WIDTH = 35
+MARGIN_LR = 16
 
 
 def circle(x, y, o=False):
-    r = ('<circle r="5" cx="{}" cy="{}" style="opacity:1;fill:#000;" />').format(x, y)
-    if o:
-        r += (
-            '<circle r="3.25" cx="{}" cy="{}" style="opacity:1;fill:#fff;"' "/>"
-        ).format(x, y)
-    return r
+    return (_CIRCLE_OPEN if o else _CIRCLE).format(x, y)
 
 
 def text(x, mora):
     # letter positioning tested with Noto Sans CJK JP
     if len(mora) == 1:
-        return (
-            '<text x="{}" y="67.5" style="font-size:20px;font-family:sans-'
-            'serif;fill:#000;">{}</text>'
-        ).format(x, mora)
-    else:
-        return (
-            '<text x="{}" y="67.5" style="font-size:20px;font-family:sans-'
-            'serif;fill:#000;">{}</text><text x="{}" y="67.5" style="font-'
-            'size:14px;font-family:sans-serif;fill:#000;">{}</text>'
-        ).format(x - 5, mora[0], x + 12, mora[1])
+        return _TEXT.format(x, mora)
+    return _TEXT.format(x - 5, mora[0]) + _TEXT_SMALL.format(x + 12, mora[1])
+
+
+_PATH_DY = {"s": 0, "u": -25, "d": 25}  # straight, up, down
 
 
 def path(x, y, typ, step_width):
-    if typ == "s":  # straight
-        delta = "{},0".format(step_width)
-    elif typ == "u":  # up
-        delta = "{},-25".format(step_width)
-    elif typ == "d":  # down
-        delta = "{},25".format(step_width)
-    return (
-        '<path d="m {},{} {}" style="fill:none;stroke:#000;stroke-width' ':1.5;" />'
-    ).format(x, y, delta)
+    return _PATH.format(x, y, step_width, _PATH_DY[typ])
 
 
 def pitch_svg(word: str, patt, silent=False):
@@ -91,61 +80,46 @@ def pitch_svg(word: str, patt, silent=False):
         はし LHL (橋)
         はし LHH (端)
     """
+    return mora_svg(to_mora(word), word, patt, silent)
 
-    mora = hira_to_mora(word)
 
+def mora_svg(mora: Sequence[str], word: str, patt, silent=False):
+    """Same as `pitch_svg`, with the morae of `word` already segmented."""
     if len(patt) - len(mora) != 1 and not silent:
-        print(
-            ("pattern should be number of morae + 1 (got: {}, {})").format(word, patt)
+        logger.warning(
+            "pattern should be number of morae + 1 (got: %s, %s)", word, patt
         )
     positions = max(len(mora), len(patt))
-    step_width = 35
-    margin_lr = 16
-    svg_width = max(0, ((positions - 1) * step_width) + (margin_lr * 2))
-
-    svg = (
-        '<svg class="pitch" width="{0}px" height="75px" viewBox="0 0 {0} 75' '">'
-    ).format(svg_width)
-    svg += '<rect width="{0}px" height="75px" style="fill:rgb(255,255,255);opacity:1"></rect>'.format(
-        svg_width
-    )
-
-    chars = ""
-    for pos, mor in enumerate(mora):
-        x_center = margin_lr + (pos * step_width)
-        chars += text(x_center - 11, mor)
-
-    circles = ""
-    paths = ""
+    svg_width = max(0, ((positions - 1) * STEP_WIDTH) + (MARGIN_LR * 2))
+
+    chars = [
+        text(MARGIN_LR + (pos * STEP_WIDTH) - 11, mor) for pos, mor in enumerate(mora)
+    ]
+
+    circles = []
+    paths = []
+    prev_y = None
     for pos, accent in enumerate(patt):
-        x_center = margin_lr + (pos * step_width)
-        if accent in ["H", "h", "1", "2"]:
-            y_center = 5
-        elif accent in ["L", "l", "0"]:
-            y_center = 30
-        circles += circle(x_center, y_center, pos >= len(mora))
+        x_center = MARGIN_LR + (pos * STEP_WIDTH)
+        y_center = _ACCENT_Y[accent]
+        circles.append(circle(x_center, y_center, pos >= len(mora)))
         if pos > 0:
-            if prev_center[1] == y_center:
+            if prev_y == y_center:
                 path_typ = "s"
-            elif prev_center[1] < y_center:
+            elif prev_y < y_center:
                 path_typ = "d"
-            elif prev_center[1] > y_center:
+            else:
                 path_typ = "u"
-            paths += path(prev_center[0], prev_center[1], path_typ, step_width)
-        prev_center = (x_center, y_center)
+            paths.append(path(x_center - STEP_WIDTH, prev_y, path_typ, STEP_WIDTH))
+        prev_y = y_center
 
-    svg += chars
-    svg += paths
-    svg += circles
-    svg += "</svg>"
-
-    return svg
+    return "".join([_SVG_HEAD.format(svg_width), *chars, *paths, *circles, _SVG_TAIL])
 
 
 # endregion
 
 
-def pitch_position_to_pattern(mora: list[str], position: int) -> str:
+def pitch_position_to_pattern(mora: Sequence[str], position: int) -> str:
     length = len(mora)
     if position == 0:
         return "0" + "1" * length
@@ -161,12 +135,60 @@ def get_pitch_position(pitch_dictionary: dict, expression: str, spelling: str) -
     return pitch_dictionary[expression][spelling]
 
 
-def get_pitch_html(expression: str, reading: str, pitch_dictionary: dict) -> str:
-    mora = hira_to_mora(reading)
-    try:
-        pitch_position = get_pitch_position(pitch_dictionary, expression, reading)
-    except KeyError:
-        return None
+# renders are memoized since many words share the same reading and accent
+SVG_CACHE_SIZE = 8192
+
 
+def _render_pitch(reading: str, pitch_position: int) -> str:
+    mora = to_mora(reading)
     pattern = pitch_position_to_pattern(mora, pitch_position)
-    return pitch_svg(reading, pattern)
+    return mora_svg(mora, reading, pattern)
+
+
+render_pitch = lru_cache(maxsize=SVG_CACHE_SIZE)(_render_pitch)
+
+
+def configure_svg_cache(maxsize: int) -> None:
+    """Replaces the render cache with an empty one of size `maxsize`."""
+    global render_pitch
+    render_pitch = lru_cache(maxsize=maxsize)(_render_pitch)
+
+
+def svg_cache_info():
+    """Returns the hits, misses, maxsize and currsize of the render cache."""
+    return render_pitch.cache_info()
+
+
+def get_pitch_html(expression: str, reading: str, pitch_dictionary: dict) -> str:
+    with instrumentation.span("pitch.render"):
+        try:
+            pitch_position = get_pitch_position(pitch_dictionary, expression, reading)
+        except KeyError:
+            return None
+
+        return render_pitch(reading, pitch_position)
+
+
+def render_many(
+    pairs: Iterable[Tuple[str, str]], pitch_dictionary: dict
+) -> List[Optional[str]]:
+    """Batch version of `get_pitch_html`.
+
+    Takes (expression, reading) pairs and returns their pitch html in the
+    same order, None when the pair is not in the dictionary. Each distinct
+    pair is looked up and rendered only once.
+    """
+    pairs = list(pairs)
+
+    with instrumentation.span("pitch.render_many"):
+        rendered = dict.fromkeys(pairs)
+        for expression, reading in rendered:
+            try:
+                pitch_position = get_pitch_position(
+                    pitch_dictionary, expression, reading
+                )
+            except KeyError:
+                continue
+            rendered[(expression, reading)] = render_pitch(reading, pitch_position)
+
+    return [rendered[p] for p in pairs]
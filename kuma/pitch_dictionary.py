@@ -0,0 +1,109 @@
+"""Lazy, sqlite backed pitch dictionary."""
+
+import json
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Optional
+
+DICTIONARY_PATH = Path(__file__).parent.joinpath("pitch_dictionary.json")
+INDEX_PATH = Path(__file__).parent.joinpath("pitch_dictionary.sqlite")
+
+# the whole index is small enough to be mapped in memory
+MMAP_SIZE = 256 * 1024 * 1024
+
+
+def build_index(json_path: Path, index_path: Path) -> None:
+    """Builds the sqlite index from the json dictionary."""
+    with json_path.open("r") as f:
+        dictionary = json.load(f)
+
+    tmp_path = index_path.with_suffix(".tmp")
+    tmp_path.unlink(missing_ok=True)
+
+    db = sqlite3.connect(tmp_path)
+    db.execute(
+        "create table pitch ("
+        "expression text not null, reading text not null, position integer, "
+        "primary key (expression, reading)) without rowid"
+    )
+    db.executemany(
+        "insert or replace into pitch values (?, ?, ?)",
+        (
+            (expression, reading, position)
+            for expression, readings in dictionary.items()
+            for reading, position in readings.items()
+        ),
+    )
+    db.commit()
+    db.close()
+
+    tmp_path.replace(index_path)
+
+
+class PitchDictionary:
+    """Read-only mapping of expression -> {reading: pitch position}.
+
+    The index is only opened (and built from the json if needed) on the
+    first lookup.
+    """
+
+    def __init__(
+        self, json_path: Path = DICTIONARY_PATH, index_path: Path = INDEX_PATH
+    ):
+        self.json_path = json_path
+        self.index_path = index_path
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is not None:
+            return self._db
+
+        if not self.index_path.exists() or (
+            self.json_path.exists()
+            and self.json_path.stat().st_mtime > self.index_path.stat().st_mtime
+        ):
+            build_index(self.json_path, self.index_path)
+
+        db = sqlite3.connect(
+            f"{self.index_path.as_uri()}?mode=ro", uri=True, check_same_thread=False
+        )
+        db.execute(f"pragma mmap_size = {MMAP_SIZE}")
+        self._db = db
+        return db
+
+    def readings(self, expression: str) -> dict:
+        with self._lock:
+            rows = (
+                self._connect()
+                .execute(
+                    "select reading, position from pitch where expression = ?",
+                    (expression,),
+                )
+                .fetchall()
+            )
+        return dict(rows)
+
+    def __getitem__(self, expression: str) -> dict:
+        readings = self.readings(expression)
+        if len(readings) == 0:
+            raise KeyError(expression)
+        return readings
+
+    def __contains__(self, expression: str) -> bool:
+        return len(self.readings(expression)) > 0
+
+    def get(self, expression: str, default=None):
+        readings = self.readings(expression)
+        return readings if len(readings) > 0 else default
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+PITCH_DICTIONARY = PitchDictionary()
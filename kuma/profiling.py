@@ -0,0 +1,136 @@
+"""Profiling of the long running threads of the imports.
+
+Enabled by the `profile` key of `config/vl.json` and `config/api.json`. Each
+profiled run writes two files in `kuma/profiles`:
+- `<name>-<time>.pstats`: cProfile statistics of the profiled thread (and of
+  every thread from Python 3.12), to open with `pstats` or snakeviz
+- `<name>-<time>.folded`: stacks of the threads of the run, sampled every few
+  milliseconds, in the collapsed format of flamegraph.pl and speedscope
+"""
+
+from collections import Counter
+import cProfile
+from datetime import datetime
+import logging
+import os
+from pathlib import Path
+import sys
+import threading
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILES_PATH = Path(__file__).parent.joinpath("profiles")
+
+# seconds between two samples of the stacks
+SAMPLING_INTERVAL = 0.005
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+def collapsed_stack(frame) -> List[str]:
+    """Returns the labels of a stack, from the outermost frame."""
+    stack = []
+    while frame is not None:
+        stack.append(frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class StackSampler:
+    """Samples the stacks of the threads started after it, and of the caller."""
+
+    def __init__(self, interval: float = SAMPLING_INTERVAL):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="kuma-sampler", daemon=True
+        )
+
+    def start(self) -> None:
+        caller = threading.get_ident()
+        # threads already running, e.g. Anki's main thread, are left out
+        self._ignored = {t.ident for t in threading.enumerate()} - {caller}
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or ident in self._ignored:
+                    continue
+                stack = [names.get(ident, str(ident))] + collapsed_stack(frame)
+                self.samples[";".join(label.replace(";", ",") for label in stack)] += 1
+
+    def write(self, path: Path) -> None:
+        with path.open("w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """Profiles the body of a `with` block, when `enabled`."""
+
+    def __init__(self, name: str, enabled: bool):
+        self.name = name
+        self.enabled = enabled
+        self.paths: List[Path] = []
+
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[StackSampler] = None
+
+    def __enter__(self) -> "Profiler":
+        if not self.enabled:
+            return self
+
+        self._started_at = datetime.now()
+        self._sampler = StackSampler()
+        self._sampler.start()
+        self._profile = cProfile.Profile()
+        try:
+            self._profile.enable()
+        except ValueError as e:  # another profiler is already running
+            logger.warning("cProfile is unavailable: %s", e)
+            self._profile = None
+        return self
+
+    def __exit__(self, *exc_info):
+        if not self.enabled:
+            return False
+
+        if self._profile is not None:
+            self._profile.disable()
+        self._sampler.stop()
+
+        try:
+            self.save()
+        except OSError as e:
+            logger.warning("could not save the profile of %s: %s", self.name, e)
+        return False
+
+    def save(self) -> None:
+        os.makedirs(PROFILES_PATH, exist_ok=True)
+        stem = f"{self.name}-{self._started_at:%Y%m%dT%H%M%S}"
+
+        if self._profile is not None:
+            pstats_path = PROFILES_PATH.joinpath(stem + ".pstats")
+            self._profile.dump_stats(pstats_path)
+            self.paths.append(pstats_path)
+
+        folded_path = PROFILES_PATH.joinpath(stem + ".folded")
+        self._sampler.write(folded_path)
+        self.paths.append(folded_path)
+
+        logger.info(
+            "Profile of %s saved to %s", self.name, ", ".join(map(str, self.paths))
+        )
@@ -0,0 +1,58 @@
+"""Rate limiting of the requests sent to JPDB."""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket with an adaptive rate.
+
+    `rate` tokens are added per second, up to `burst`. The rate is halved
+    each time the server throttles us, and slowly recovers on success.
+    """
+
+    def __init__(self, rate: float, burst: int = 1, *, min_rate: float = 0.1):
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.burst = max(1, burst)
+
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self) -> None:
+        """Blocks until a request can be sent."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def throttled(self) -> None:
+        """Multiplicative decrease, called when a 429 is received."""
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0.0
+
+    def succeeded(self) -> None:
+        """Additive increase, called after a successful request."""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+def from_config(config: dict) -> TokenBucket:
+    """Creates a bucket from the `config/vl.json` settings."""
+    rate = config.get("requests_per_second", 2.0)
+    sleep_time = config.get("sleep_time", 0.0)
+    if sleep_time > 0:
+        rate = min(rate, 1 / sleep_time)
+    return TokenBucket(rate, config.get("burst", 2))
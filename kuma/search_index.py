@@ -0,0 +1,300 @@
+"""In-memory index of the Kuma notes of a deck, for instant searches."""
+
+from bisect import bisect_left, insort
+import logging
+import re
+import sys
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+import unicodedata
+
+import anki.collection
+from anki import hooks
+from anki.utils import ids2str
+from aqt import gui_hooks
+
+from .anki import KumaAnki
+
+logger = logging.getLogger(__name__)
+
+# katakana -> hiragana, they are the same characters 0x60 code points apart
+_KATAKANA_TO_HIRAGANA = {k: k - 0x60 for k in range(ord("ァ"), ord("ヶ") + 1)}
+
+# a ruby base (anything but kana) followed by its reading, as in 食[た]べる
+_RUBY_PATTERN = re.compile(r"[^\u3040-\u30ff\[\]]+\[([^\]]*)\]")
+_TAG_PATTERN = re.compile(r"<[^>]*>")
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    """Normalizes width, case and kana, so that カナ matches かな."""
+    return (
+        unicodedata.normalize("NFKC", text)
+        .casefold()
+        .translate(_KATAKANA_TO_HIRAGANA)
+        .strip()
+    )
+
+
+def reading_of(spelling: str) -> str:
+    """Returns the kana reading of a spelling field.
+
+    Example:
+        in:  '食[た]べ物[もの]'
+        out: 'たべもの'
+    """
+    return _RUBY_PATTERN.sub(r"\1", spelling)
+
+
+def index_keys(expression: str, spelling: str, meanings: str) -> Set[str]:
+    """Returns the normalized keys under which a note is found."""
+    keys = {normalize(expression), normalize(reading_of(spelling))}
+    keys.update(
+        normalize(word)
+        for word in _WORD_PATTERN.findall(_TAG_PATTERN.sub(" ", meanings))
+        if not word.isdigit()  # numbering of the meanings
+    )
+    keys.discard("")
+    return keys
+
+
+class ExpressionIndex:
+    """Prefix index of the Expression, Spelling and Meanings of a deck.
+
+    Keys are kept sorted, so a lookup is a bisection followed by a scan of the
+    keys sharing the prefix. The index is marked stale by the collection hooks
+    and refreshed from the notes modified since the last build.
+    """
+
+    def __init__(self, deck_name: str):
+        self.deck_name = deck_name
+        self.ready = False
+        self.stale = False
+
+        self._lock = threading.Lock()
+        self._keys: List[str] = []
+        self._postings: Dict[str, Set[int]] = {}
+        self._note_keys: Dict[int, Set[str]] = {}
+        self._expressions: Dict[int, str] = {}
+        self._mod = 0
+
+    def __len__(self) -> int:
+        return len(self._expressions)
+
+    def _query(self) -> str:
+        return f'"deck:{self.deck_name}" "note:{KumaAnki.model_name}"'
+
+    def _field_indices(self, col: anki.collection.Collection) -> Optional[tuple]:
+        model = col.models.by_name(KumaAnki.model_name)
+        if model is None:
+            return None
+        field_map = col.models.field_map(model)
+        return tuple(field_map[f][0] for f in ("Expression", "Spelling", "Meanings"))
+
+    def _add(self, nid: int, expression: str, keys: Set[str]) -> None:
+        self._expressions[nid] = expression
+        self._note_keys[nid] = keys
+        for key in keys:
+            postings = self._postings.get(key)
+            if postings is None:
+                postings = self._postings[key] = set()
+                insort(self._keys, key)
+            postings.add(nid)
+
+    def _remove(self, nid: int) -> None:
+        self._expressions.pop(nid, None)
+        for key in self._note_keys.pop(nid, ()):
+            postings = self._postings[key]
+            postings.discard(nid)
+            if len(postings) == 0:
+                del self._postings[key]
+                del self._keys[bisect_left(self._keys, key)]
+
+    def build(self, col: anki.collection.Collection) -> None:
+        """Indexes every Kuma note of the deck. Safe to run in the background."""
+        start = time.perf_counter()
+
+        indices = self._field_indices(col)
+        nids = list(map(int, col.find_notes(self._query())))
+
+        expressions: Dict[int, str] = {}
+        note_keys: Dict[int, Set[str]] = {}
+        postings: Dict[str, Set[int]] = {}
+        mod = 0
+        if indices is not None and len(nids) > 0:
+            i_expression, i_spelling, i_meanings = indices
+            for nid, note_mod, flds in col.db.execute(
+                f"select id, mod, flds from notes where id in {ids2str(nids)}"
+            ):
+                fields = flds.split("\x1f")
+                keys = index_keys(
+                    fields[i_expression], fields[i_spelling], fields[i_meanings]
+                )
+                expressions[nid] = fields[i_expression]
+                note_keys[nid] = keys
+                for key in keys:
+                    postings.setdefault(key, set()).add(nid)
+                mod = max(mod, note_mod)
+
+        with self._lock:
+            self._expressions = expressions
+            self._note_keys = note_keys
+            self._postings = postings
+            self._keys = sorted(postings)
+            self._mod = mod
+            self.ready = True
+            self.stale = False
+
+        elapsed = time.perf_counter() - start
+        logger.info(
+            "Indexed %d notes of %s in %.2fs (%s)",
+            len(expressions),
+            self.deck_name,
+            elapsed,
+            self.footprint_report(),
+        )
+
+    def refresh(self, col: anki.collection.Collection) -> None:
+        """Reindexes the notes added, moved or modified since the last build."""
+        if not self.ready:
+            return self.build(col)
+
+        indices = self._field_indices(col)
+        if indices is None:
+            return self.build(col)
+        i_expression, i_spelling, i_meanings = indices
+
+        nids = set(map(int, col.find_notes(self._query())))
+        changed = []
+        if len(nids) > 0:
+            # mod has a one second resolution, notes of the last second are redone
+            changed = col.db.all(
+                f"select id, mod, flds from notes where id in {ids2str(nids)} "
+                "and mod >= ?",
+                self._mod,
+            )
+
+        with self._lock:
+            for nid in set(self._expressions) - nids:
+                self._remove(nid)
+
+            for nid, note_mod, flds in changed:
+                fields = flds.split("\x1f")
+                keys = index_keys(
+                    fields[i_expression], fields[i_spelling], fields[i_meanings]
+                )
+                self._remove(nid)
+                self._add(nid, fields[i_expression], keys)
+                self._mod = max(self._mod, note_mod)
+
+            # notes moved into the deck keep their old mod, they need a rebuild
+            moved = len(nids - self._expressions.keys()) > 0
+            self.stale = False
+
+        if moved:
+            self.build(col)
+
+    def remove_notes(self, nids: Iterable[int]) -> None:
+        with self._lock:
+            for nid in nids:
+                self._remove(int(nid))
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[tuple[int, str]]:
+        """Returns the (note id, expression) of the notes with a key starting
+        with the query, shortest expressions first."""
+        prefix = normalize(query)
+        if prefix == "":
+            return []
+
+        with self._lock:
+            nids: Set[int] = set()
+            i = bisect_left(self._keys, prefix)
+            while i < len(self._keys) and self._keys[i].startswith(prefix):
+                nids.update(self._postings[self._keys[i]])
+                i += 1
+            results = [(nid, self._expressions[nid]) for nid in nids]
+
+        results.sort(key=lambda result: (len(result[1]), result[1], result[0]))
+        return results if limit is None else results[:limit]
+
+    def memory_usage(self) -> int:
+        """Approximate size in bytes of the index structures."""
+        with self._lock:
+            size = sys.getsizeof(self._keys) + sum(map(sys.getsizeof, self._keys))
+            size += sys.getsizeof(self._postings) + sum(
+                map(sys.getsizeof, self._postings.values())
+            )
+            size += sys.getsizeof(self._note_keys) + sum(
+                map(sys.getsizeof, self._note_keys.values())
+            )
+            size += sys.getsizeof(self._expressions) + sum(
+                map(sys.getsizeof, self._expressions.values())
+            )
+            # note ids are shared between the structures, count them once
+            size += sum(map(sys.getsizeof, self._expressions))
+        return size
+
+    def footprint_report(self) -> str:
+        size = self.memory_usage() / (1024 * 1024)
+        if len(self) == 0:
+            return f"{size:.1f} MB"
+        per_10k = size * 10_000 / len(self)
+        return f"{size:.1f} MB, {per_10k:.1f} MB per 10k notes"
+
+
+_indexes: Dict[str, ExpressionIndex] = {}
+_hooks_installed = False
+
+
+def get_index(deck_name: str) -> ExpressionIndex:
+    """Returns the index of a deck, created empty on the first call."""
+    install_hooks()
+    if deck_name not in _indexes:
+        _indexes[deck_name] = ExpressionIndex(deck_name)
+    return _indexes[deck_name]
+
+
+def clear_indexes() -> None:
+    """Forgets the indexes, whose note ids belong to the collection they were
+    built from. Indexes still held by a widget are rebuilt on their next use."""
+    for index in _indexes.values():
+        with index._lock:
+            index.ready = False
+    _indexes.clear()
+
+
+def mark_stale() -> None:
+    for index in _indexes.values():
+        index.stale = True
+
+
+def _on_note_will_be_added(col, note, deck_id) -> None:
+    mark_stale()
+
+
+def _on_notes_will_be_deleted(col, ids) -> None:
+    for index in _indexes.values():
+        index.remove_notes(ids)
+
+
+def _on_operation_did_execute(changes, handler) -> None:
+    if changes.note_text or changes.card:
+        mark_stale()
+
+
+def _on_collection_did_load(col) -> None:
+    clear_indexes()
+
+
+def install_hooks() -> None:
+    global _hooks_installed
+    if _hooks_installed:
+        return
+    hooks.note_will_be_added.append(_on_note_will_be_added)
+    hooks.notes_will_be_deleted.append(_on_notes_will_be_deleted)
+    gui_hooks.operation_did_execute.append(_on_operation_did_execute)
+    # a profile switch or a full sync opens another collection
+    gui_hooks.profile_will_close.append(clear_indexes)
+    gui_hooks.collection_did_load.append(_on_collection_did_load)
+    _hooks_installed = True
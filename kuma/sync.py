@@ -0,0 +1,109 @@
+"""Differential sync of the notes of a deck with a JPDB deck or vocabulary list.
+
+The last sync of each (Anki deck, JPDB source) pair is kept as a snapshot in
+`kuma/sync`: the vocabulary ids that were synced, and a hash of their
+frequency and meanings. The next sync compares the current ids and hashes to
+the snapshot, and only fetches and applies the difference.
+"""
+
+from dataclasses import dataclass, field
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SYNC_PATH = Path(__file__).parent.joinpath("sync")
+
+
+def content_hash(frequency, meanings) -> str:
+    """Hash of the fields of a note that change on JPDB."""
+    data = json.dumps([str(frequency), meanings], ensure_ascii=False)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()[:16]
+
+
+class Snapshot:
+    """Ids and content hashes of the last sync of a deck with a JPDB source."""
+
+    def __init__(self, deck_id: int, source: str, path: Optional[Path] = None):
+        self.path = path if path is not None else SYNC_PATH
+        self.key = f"{deck_id}-{source}"
+        self.hashes: Dict[str, str] = {}
+
+    @property
+    def file_path(self) -> Path:
+        return self.path.joinpath(self.key + ".json")
+
+    def load(self) -> "Snapshot":
+        if self.file_path.exists():
+            with self.file_path.open("r") as f:
+                self.hashes = json.load(f)
+        return self
+
+    def save(self, hashes: Dict[str, str]) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        with self.file_path.open("w") as f:
+            json.dump(hashes, f)
+        self.hashes = hashes
+
+
+@dataclass
+class Delta:
+    """Difference between the current ids of a JPDB source and a deck."""
+
+    # not in the deck yet
+    new: List[str] = field(default_factory=list)
+    # in the deck and still on JPDB, their content may have changed
+    kept: List[str] = field(default_factory=list)
+    # synced before, still in the deck, but no longer on JPDB
+    removed: List[str] = field(default_factory=list)
+
+    def summary(self) -> str:
+        return (
+            f"{len(self.new)} new, {len(self.kept)} kept, "
+            f"{len(self.removed)} removed"
+        )
+
+
+def compute_delta(snapshot: Snapshot, ids: Iterable[str], deck_ids) -> Delta:
+    """Splits the current `ids` of a source against a snapshot and a deck.
+
+    `deck_ids` are the ID fields of the notes of the deck, e.g. a
+    `DeckIdIndex`. Only the notes of a previous sync can be removed, so that
+    notes added from elsewhere are left alone.
+    """
+    delta = Delta()
+    current = set()
+    for note_id in map(str, ids):
+        if note_id in current:
+            continue
+        current.add(note_id)
+        if note_id in deck_ids:
+            delta.kept.append(note_id)
+        else:
+            delta.new.append(note_id)
+
+    delta.removed = [
+        note_id
+        for note_id in snapshot.hashes
+        if note_id not in current and note_id in deck_ids
+    ]
+    logger.info("Sync of %s: %s", snapshot.key, delta.summary())
+    return delta
+
+
+def changed(snapshot: Snapshot, hashes: Dict[str, str]) -> List[str]:
+    """Returns the ids whose hash differs from the one of the snapshot.
+
+    Ids missing from the snapshot, e.g. all of them on the first sync of a
+    deck, are not reported: their notes may have been edited since they were
+    added, the sync only seeds their hashes.
+    """
+    return [
+        note_id
+        for note_id, content in hashes.items()
+        if note_id in snapshot.hashes and snapshot.hashes[note_id] != content
+    ]
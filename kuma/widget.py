@@ -1,34 +1,112 @@
 """Contains the features' interfaces."""
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import json
-import os
+import logging
 from pathlib import Path
-import time
 from typing import Optional, List
 
+import requests
+
+from anki.collection import SearchNode
 import aqt
 from aqt.utils import showInfo
 import aqt.editor
+from aqt.operations import CollectionOp, QueryOp
 from PyQt6.QtCore import Qt
 
 
-from .anki import KumaAnki, reposition_on_frequency, is_in_deck
+from . import client
+from . import instrumentation
+from . import profiling
+from . import ratelimit
+from . import sync
+from .anki import KumaAnki, DeckIdIndex
+from .anki import reposition_on_frequency, slot_notes_on_frequency
 from .jpdb import JPDB, JPDB_Note
 from .jpdb import search_all_expressions_jpdb_url
-from .jpdb import load_url
-from .jpdb import get_all_entries_from_one_page
 from .jpdb import extract_id
+from .crawler import VocabListCache, VocabListCrawler
+from .search_index import ExpressionIndex, get_index
 from .jpdb_api import JpdbAPI, to_jpdb_note, Note
 
+logger = logging.getLogger(__name__)
+
+
+class SearchResultsModel(aqt.QAbstractListModel):
+    """Read-only list of (note id, expression) search results.
+
+    Rows are only formatted when the view asks for them, so large result sets
+    are displayed instantly.
+    """
+
+    def __init__(self, parent: Optional[aqt.QObject] = None):
+        super().__init__(parent)
+        self.results: List[tuple[int, str]] = []
+
+    def set_results(self, results: List[tuple[int, str]]) -> None:
+        self.beginResetModel()
+        self.results = results
+        self.endResetModel()
+
+    def note_id(self, row: int) -> Optional[int]:
+        if 0 <= row < len(self.results):
+            return self.results[row][0]
+        return None
+
+    def rowCount(self, parent=aqt.QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return len(self.results)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        note_id, expression = self.results[index.row()]
+        return "Note " + expression + " with id " + str(note_id)
+
+
+def search_refreshed_index(
+    index: ExpressionIndex, query: str, col
+) -> List[tuple[int, str]]:
+    index.refresh(col)
+    return index.search(query)
+
+
+def search_deck_expressions(deck_name: str, query: str, col) -> List[tuple[int, str]]:
+    """Searches the Expression field of the notes of a deck for `query`, as
+    plain text: quotes, wildcards and search operators are escaped."""
+    search = col.build_search_string(
+        SearchNode(deck=deck_name),
+        SearchNode(field=SearchNode.Field(field_name="expression", text=query)),
+    )
+    return KumaAnki.search_expressions(search, col)
+
 
 class Anki_SearchWidget(aqt.QWidget):
-    def __init__(self, parent: aqt.QWidget, *, previous_query: Optional[str] = None):
+    # delay between the last keystroke and the search, in ms
+    search_delay: int = 250
+
+    def __init__(
+        self,
+        parent: aqt.QWidget,
+        *,
+        previous_query: Optional[str] = None,
+        decks_list: Optional[List[str]] = None,
+    ):
         super().__init__(parent)
 
         self.query_lineEdit = aqt.QLineEdit(previous_query, self)
-        self.query_results_list = aqt.QListWidget(self)
+        self.query_results_model = SearchResultsModel(self)
+        self.query_results_list = aqt.QListView(self)
+        self.query_results_list.setModel(self.query_results_model)
+        self.query_results_list.setUniformItemSizes(True)
         self.search_button = aqt.QPushButton("Search Anki Collection", self)
 
+        self.search_timer = aqt.QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.search_delay)
+
         self.query_menu = aqt.QMenu(self)
         self.reposition_action = self.query_menu.addAction("Study Next")
         self.reposition_action.triggered.connect(self.on_reposition_action)
@@ -40,6 +118,7 @@ class Anki_SearchWidget(aqt.QWidget):
         )
 
         self.select_deck_comboBox = aqt.QComboBox(self)
+        self.index_checkBox = aqt.QCheckBox("Use in-memory index", self)
 
         self.main_layout = aqt.QHBoxLayout(self)
         self.search_layout = aqt.QFormLayout(self)
@@ -51,11 +130,15 @@ class Anki_SearchWidget(aqt.QWidget):
         self.query_result_urls = []
         self.current_query_result = -1
 
-        self.decks_list = KumaAnki.decks().all_names(force_default=False)
+        self.decks_list = (
+            decks_list if decks_list is not None else KumaAnki.deck_names()
+        )
         self.current_deck = self.decks_list[0]
         self._can_generate = False
 
-        self.notes_id = []
+        # incremented by every search, results of older searches are dropped
+        self.search_seq = 0
+        self.index: Optional[ExpressionIndex] = None
 
         self.widget_init()
 
@@ -66,49 +149,112 @@ class Anki_SearchWidget(aqt.QWidget):
     def layout_init(self):
         self.search_layout.addRow("Query: ", self.query_lineEdit)
         self.search_layout.addRow("Select Deck: ", self.select_deck_comboBox)
+        self.search_layout.addWidget(self.index_checkBox)
         self.search_layout.addWidget(self.search_button)
         self.search_layout.addWidget(self.query_results_list)
 
     def widget_init(self):
         self.query_lineEdit.returnPressed.connect(self.on_search_pressed)
+        self.query_lineEdit.textChanged.connect(self.search_timer.start)
+        self.search_timer.timeout.connect(self.on_search_pressed)
 
         self.select_deck_comboBox.addItems(self.decks_list)
         self.select_deck_comboBox.currentIndexChanged.connect(self.on_deck_selected)
 
+        self.index_checkBox.stateChanged.connect(self.on_index_toggled)
+
         self.search_button.pressed.connect(self.on_search_pressed)
 
-        self.query_results_list.currentItemChanged.connect(self.on_note_selected)
+        self.query_results_list.selectionModel().currentChanged.connect(
+            self.on_note_selected
+        )
 
     def on_deck_selected(self):
         self.current_deck = self.select_deck_comboBox.currentText()
+        if self.index_checkBox.isChecked():
+            self.load_index()
+        self.search_timer.start()
+
+    def on_index_toggled(self):
+        if self.index_checkBox.isChecked():
+            self.load_index()
+        else:
+            self.index = None
+
+    def load_index(self):
+        """Builds the index of the current deck in the background, if needed."""
+        self.index = get_index(self.current_deck)
+        if self.index.ready and not self.index.stale:
+            return
+
+        index = self.index
+        QueryOp(
+            parent=self,
+            op=index.refresh,
+            success=lambda _: self.search_timer.start(),
+        ).run_in_background()
 
     def on_search_pressed(self):
-        self.query_results_list.clear()
+        self.search_timer.stop()
+        self.search_seq += 1
+        seq = self.search_seq
 
         query = self.query_lineEdit.text()
         if query == "":
+            self.query_results_model.set_results([])
             return
-        query = f'"deck:{self.current_deck}" expression:' + query
 
-        self.notes_id = KumaAnki.find_notes(query)
-        notes_info = []
-        for note_id in self.notes_id:
-            note_name = KumaAnki.collection().get_note(note_id).fields[0]
-            notes_info.append("Note " + note_name + " with id " + str(note_id))
-        self.query_results_list.addItems(notes_info)
+        index = self.index
+        if index is not None and index.ready and not index.stale:
+            self.query_results_model.set_results(index.search(query))
+            return
+        if index is not None:
+            QueryOp(
+                parent=self,
+                op=lambda col: search_refreshed_index(index, query, col),
+                success=lambda results: self.on_search_done(seq, results),
+            ).failure(lambda e: self.on_search_failed(seq, e)).run_in_background()
+            return
+
+        deck_name = self.current_deck
+        QueryOp(
+            parent=self,
+            op=lambda col: search_deck_expressions(deck_name, query, col),
+            success=lambda results: self.on_search_done(seq, results),
+        ).failure(lambda e: self.on_search_failed(seq, e)).run_in_background()
+
+    def on_search_done(self, seq: int, results: List[tuple[int, str]]):
+        if seq != self.search_seq:
+            return  # superseded by a newer search
+        self.query_results_model.set_results(results)
+
+    def on_search_failed(self, seq: int, error: Exception):
+        # the search runs while typing, an error is not worth a dialog
+        logger.debug("search %d failed: %s", seq, error)
+        if seq != self.search_seq:
+            return
+        self.query_results_model.set_results([])
+
+    def current_note_id(self) -> Optional[int]:
+        return self.query_results_model.note_id(
+            self.query_results_list.currentIndex().row()
+        )
 
     def on_note_selected(self):
-        note_id = self.notes_id[self.query_results_list.currentIndex().row()]
+        note_id = self.current_note_id()
+        if note_id is None:
+            return
         self.editor.set_note(KumaAnki.collection().get_note(note_id))
 
     def show_context_menu(self, pos):
-        item = self.query_results_list.itemAt(pos)
-        if item is None:
+        if not self.query_results_list.indexAt(pos).isValid():
             return
         self.query_menu.popup(self.query_results_list.mapToGlobal(pos))
 
     def on_reposition_action(self):
-        note_id = self.notes_id[self.query_results_list.currentIndex().row()]
+        note_id = self.current_note_id()
+        if note_id is None:
+            return
         cards_id = KumaAnki.get_cards_of_note(note_id)
 
         for card_id in cards_id:
@@ -121,7 +267,13 @@ class Anki_SearchWidget(aqt.QWidget):
 
 
 class JPDB_SearchWidget(aqt.QWidget):
-    def __init__(self, parent: aqt.QWidget, *, previous_query: Optional[str] = None):
+    def __init__(
+        self,
+        parent: aqt.QWidget,
+        *,
+        previous_query: Optional[str] = None,
+        decks_list: Optional[List[str]] = None,
+    ):
         super().__init__(parent)
 
         self.query_lineEdit = aqt.QLineEdit(previous_query, self)
@@ -138,7 +290,9 @@ class JPDB_SearchWidget(aqt.QWidget):
         self.query_result_urls = []
         self.current_query_result = -1
 
-        self.decks_list = KumaAnki.decks().all_names(force_default=False)
+        self.decks_list = (
+            decks_list if decks_list is not None else KumaAnki.deck_names()
+        )
         self.current_deck = self.decks_list[0]
         self._can_generate = False
 
@@ -201,7 +355,11 @@ class JPDB_SearchWidget(aqt.QWidget):
         if query == "":
             return
 
-        query_results_entries = search_all_expressions_jpdb_url(query)
+        try:
+            query_results_entries = search_all_expressions_jpdb_url(query)
+        except requests.RequestException as e:
+            showInfo(f"Search failed: {e}")
+            return
         self.query_result_urls = list(
             map(lambda x: JPDB.base_url + x, query_results_entries)
         )
@@ -219,11 +377,15 @@ class JPDB_SearchWidget(aqt.QWidget):
         jpdb_url = self.query_result_urls[url_index]
 
         note_id = extract_id(jpdb_url)
-        if is_in_deck(self.current_deck, note_id):
+        if KumaAnki.has_note(self.current_deck, note_id):
             showInfo("Note already exists!")
             return
 
-        jpdb_note = JPDB_Note.from_jpdb(jpdb_url)
+        try:
+            jpdb_note = JPDB_Note.from_jpdb(jpdb_url)
+        except requests.RequestException as e:
+            showInfo(f"Note could not be loaded: {e}")
+            return
         KumaAnki.add_note(jpdb_note, self.current_deck)
 
         showInfo("Note successfully generated.")
@@ -231,80 +393,217 @@ class JPDB_SearchWidget(aqt.QWidget):
 
 class VLSearchThread(aqt.QThread):
     finished = aqt.pyqtSignal(list)
+    failed = aqt.pyqtSignal(str)
     next_page = aqt.pyqtSignal(int)
 
-    def __init__(self, url: str, sleep_time: float):
+    def __init__(self, url: str, config: dict, revalidate: bool = False):
         super().__init__()
         self.url = url
+        self.revalidate = revalidate
 
-        self.sleep_time = sleep_time
+        self.config = config
+        self.recording = instrumentation.Recording(
+            "vl-search", config.get("instrumentation", False)
+        )
+        self.profiler = profiling.Profiler("vl-search", config.get("profile", False))
 
     def run(self):
-        entries = self.get_all_entries_from_vocab_list(self.url)
-        self.finished.emit(entries)
-
-    def get_all_entries_from_vocab_list(self, vl_url):
-        time.sleep(self.sleep_time)
-
+        # the prefetched pages share the token bucket, which slows down
+        # whenever a 429 is received
+        limiter = ratelimit.from_config(self.config)
+        crawler = VocabListCrawler(
+            self.url,
+            VocabListCache(self.url),
+            limiter,
+            prefetch=self.config.get("workers", 4),
+            on_page=self.next_page.emit,
+            revalidate=self.revalidate,
+        )
+        client.add_throttle_listener(limiter.throttled)
         try:
-            self.next_page.emit(int(vl_url.split("=")[-1]))
-        except ValueError:
-            self.next_page.emit(0)
-
-        jpdb_soup = load_url(vl_url)
-        entries = get_all_entries_from_one_page(jpdb_soup)
-        entries = [JPDB.base_url + e.strip("#a") for e in entries]
-
-        # last page
-        if jpdb_soup.find(class_="pagination without-next"):
-            return entries
+            with self.profiler, self.recording:
+                entries = crawler.crawl()
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        finally:
+            client.remove_throttle_listener(limiter.throttled)
+        self.finished.emit(entries)
 
-        # first page
-        without_prev = jpdb_soup.find(class_="pagination without-prev")
-        if without_prev:
-            next_root = without_prev.find_all("a", href=True)[-1]["href"][:-2]
-            entries += self.get_all_entries_from_vocab_list(JPDB.base_url + next_root)
-            return entries
 
-        next_root = jpdb_soup.find(class_="pagination")
-        next_root = next_root.find_all("a", href=True)[-1]["href"][:-2]
-        entries += self.get_all_entries_from_vocab_list(JPDB.base_url + next_root)
-        return entries
+class VLGenerationThread(aqt.QThread):
+    """Adds the notes of the entries of a vocabulary list that are missing.
 
+    With `sync`, the entries are also compared to the snapshot of the last
+    sync of `vl_url`, and with `remove` the notes no longer in the list are
+    removed. Pages of the entries already in the deck are not fetched, so
+    their changes are not detected.
+    """
 
-class VLGenerationThread(aqt.QThread):
     finished = aqt.pyqtSignal()
     generated = aqt.pyqtSignal(int)
 
-    def __init__(self, current_deck: str, urls: List[str], sleep_time: float):
+    def __init__(
+        self,
+        current_deck: str,
+        urls: List[str],
+        config: dict,
+        *,
+        vl_url: Optional[str] = None,
+        sync: bool = False,
+        remove: bool = False,
+    ):
         super().__init__()
         self.current_deck = current_deck
         self.urls = urls
-
-        self.sleep_time = sleep_time
+        self.vl_url = vl_url
+        self.sync = sync and vl_url is not None
+        self.remove = remove and self.sync
+        self.n_added = 0
+        self.n_failed = 0
+        self.n_removed = 0
+        self.error = None
+
+        self.config = config
+        self.chunk_size = 50
+        self.recording = instrumentation.Recording(
+            "vl-generation", config.get("instrumentation", False)
+        )
+        self.profiler = profiling.Profiler(
+            "vl-generation", config.get("profile", False)
+        )
 
     def run(self):
-        # cannot be multithreaded due to JPDB constraints
-        for i, url in enumerate(self.urls):
-            self.generated.emit(i)
-
+        try:
+            with self.profiler, self.recording:
+                self.generate()
+        except Exception as e:
+            # a failure must still end the generation in the interface
+            logger.exception("Vocabulary list generation failed")
+            self.error = f"Generation failed: {e}"
+        finally:
+            self.finished.emit()
+
+    def generate(self):
+        index = DeckIdIndex(self.current_deck)
+        if self.sync:
+            snapshot = sync.Snapshot(
+                KumaAnki.deck(self.current_deck)["id"],
+                "vl-" + VocabListCache(self.vl_url).key,
+            ).load()
+            delta = sync.compute_delta(snapshot, map(extract_id, self.urls), index)
+            # the pages of the kept entries are not fetched, their hash is kept
+            hashes = {
+                note_id: snapshot.hashes.get(note_id, "") for note_id in delta.kept
+            }
+        else:
+            delta = None
+
+        to_fetch = []
+        for url in self.urls:
             note_id = extract_id(url)
-            if is_in_deck(self.current_deck, note_id):
+            if note_id in index:
                 continue
+            index.add(note_id)
+            to_fetch.append(url)
+        n_done = len(self.urls) - len(to_fetch)
+        self.generated.emit(n_done)
+
+        # JPDB throttles clients: a shared token bucket paces all the fetchers,
+        # and slows down whenever a 429 is received
+        limiter = ratelimit.from_config(self.config)
+        client.add_throttle_listener(limiter.throttled)
+
+        def fetch(url: str) -> Optional[JPDB_Note]:
+            # pages in the response cache are not paced
+            return JPDB_Note.from_jpdb(url, limiter)
 
-            time.sleep(self.sleep_time)
-            jpdb_note = JPDB_Note.from_jpdb(url)
+        undo_entry = KumaAnki.add_undo_entry()
+        to_add = []
 
-            if jpdb_note is None:
-                print(f"url {url} was not loaded and skipped")
-                continue  # skip
-            KumaAnki.add_note(jpdb_note, self.current_deck)
+        def flush():
+            added = KumaAnki.add_notes(to_add, self.current_deck, undo_entry=undo_entry)
+            slot_notes_on_frequency(self.current_deck, added, undo_entry)
+            self.n_added += len(added)
+            to_add.clear()
 
-        self.finished.emit()
+        n_workers = max(1, self.config.get("workers", 4))
+        urls_iter = iter(to_fetch)
+        pending = {}  # future -> url
+
+        try:
+            with ThreadPoolExecutor(max_workers=n_workers) as pool:
+
+                def submit_next():
+                    url = next(urls_iter, None)
+                    if url is not None:
+                        pending[pool.submit(fetch, url)] = url
+
+                for _ in range(2 * n_workers):
+                    submit_next()
+
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        url = pending.pop(future)
+                        submit_next()
+
+                        n_done += 1
+                        self.generated.emit(n_done)
+
+                        try:
+                            jpdb_note = future.result()
+                        except Exception as e:
+                            logger.warning("url %s failed to load: %s", url, e)
+                            jpdb_note = None
+                        if jpdb_note is None:
+                            logger.warning("url %s was not loaded and skipped", url)
+                            self.n_failed += 1
+                            continue  # skip
+                        to_add.append(jpdb_note)
+                        if delta is not None:
+                            hashes[jpdb_note.note_id] = sync.content_hash(
+                                jpdb_note.frequency, jpdb_note.meanings
+                            )
+
+                    if len(to_add) >= self.chunk_size:
+                        flush()
+            flush()
+        finally:
+            client.remove_throttle_listener(limiter.throttled)
+
+        if delta is not None:
+            self.sync_deck(snapshot, delta, hashes, undo_entry)
+
+    def sync_deck(
+        self,
+        snapshot: sync.Snapshot,
+        delta: sync.Delta,
+        hashes: dict,
+        undo_entry: int,
+    ) -> None:
+        if self.remove:
+            nids = KumaAnki.notes_by_id(self.current_deck)
+            self.n_removed = KumaAnki.remove_notes(
+                [nids[note_id] for note_id in delta.removed if note_id in nids],
+                undo_entry,
+            )
+        else:
+            # kept in the snapshot, to be removed by a later sync
+            for note_id in delta.removed:
+                hashes[note_id] = snapshot.hashes[note_id]
+
+        snapshot.save(hashes)
 
 
 class JPDB_VocabListWidget(aqt.QWidget):
-    def __init__(self, parent: aqt.QWidget, *, previous_query: Optional[str] = None):
+    def __init__(
+        self,
+        parent: aqt.QWidget,
+        *,
+        previous_query: Optional[str] = None,
+        decks_list: Optional[List[str]] = None,
+    ):
         super().__init__(parent)
 
         self.query_lineEdit = aqt.QLineEdit(previous_query, self)
@@ -319,11 +618,23 @@ class JPDB_VocabListWidget(aqt.QWidget):
         self.deck_label = aqt.QLabel("Select a deck", self)
         self.select_deck_comboBox = aqt.QComboBox(self)
 
+        self.sync_checkBox = aqt.QCheckBox("Sync with the list on JPDB", self)
+        self.sync_checkBox.setToolTip(
+            "Searches the list again, and only fetches the entries added since "
+            "the last sync of this deck."
+        )
+        self.remove_checkBox = aqt.QCheckBox(
+            "Remove the notes no longer in the list", self
+        )
+        self.remove_checkBox.setEnabled(False)
+
         self.generate_button = aqt.QPushButton("Generate all notes", self)
 
         self.can_search = True
         self.can_generate = False
-        self.decks_list = KumaAnki.decks().all_names(force_default=False)
+        self.decks_list = (
+            decks_list if decks_list is not None else KumaAnki.deck_names()
+        )
         self.current_deck = self.decks_list[0]
 
         self.prog_bar = aqt.QProgressBar(self)
@@ -341,8 +652,12 @@ class JPDB_VocabListWidget(aqt.QWidget):
         # help avoid throttle ?
         self.path_to_config = Path(__file__).resolve().parent / "config" / "vl.json"
         if not self.path_to_config.exists():
-            json.dump({"sleep_time": 0.0}, self.path_to_config.open("r"))
-        self.sleep_time = json.load(open(self.path_to_config, "r"))["sleep_time"]
+            with self.path_to_config.open("w") as f:
+                json.dump(
+                    {"sleep_time": 0.0, "instrumentation": False, "profile": False}, f
+                )
+        with self.path_to_config.open("r") as f:
+            self.config = json.load(f)
 
     def layout_init(self):
         self._layout.addRow("Query: ", self.query_lineEdit)
@@ -351,6 +666,8 @@ class JPDB_VocabListWidget(aqt.QWidget):
         self._layout.addWidget(self.query_results_list)
         self._layout.addWidget(self.deck_label)
         self._layout.addWidget(self.select_deck_comboBox)
+        self._layout.addWidget(self.sync_checkBox)
+        self._layout.addWidget(self.remove_checkBox)
         self._layout.addWidget(self.generate_button)
         self._layout.addWidget(self.prog_bar)
 
@@ -365,6 +682,7 @@ class JPDB_VocabListWidget(aqt.QWidget):
         )
         self.select_deck_comboBox.addItems(self.decks_list)
         self.select_deck_comboBox.currentIndexChanged.connect(self.on_deck_selected)
+        self.sync_checkBox.toggled.connect(self.remove_checkBox.setEnabled)
 
         self.generate_button.pressed.connect(self.generate_or_update)
 
@@ -389,21 +707,34 @@ class JPDB_VocabListWidget(aqt.QWidget):
             return
         self.last_query = query
 
-        entries = self.load_urls(query)
+        # a sync crawls the list again, to see its current entries
+        syncing = self.sync_checkBox.isChecked()
+        entries = [] if syncing else VocabListCache(query).load_urls()
         if len(entries) > 0:
             self._on_search_finished(entries)
             return
 
         self.wait_label.show()
 
-        self.search_worker = VLSearchThread(query, self.sleep_time)
+        self.search_worker = VLSearchThread(query, self.config, revalidate=syncing)
         self.search_worker.next_page.connect(self._on_searching)
         self.search_worker.finished.connect(self._on_search_finished)
+        self.search_worker.finished.connect(self._on_search_report)
         self.search_worker.finished.connect(self.search_worker.quit)
+        self.search_worker.failed.connect(self._on_search_failed)
+        self.search_worker.failed.connect(self.search_worker.quit)
         self.search_worker.start()
 
-    def _on_searching(self, offset):
-        self.wait_label.setText(str(offset) + " entries collected.")
+    def _on_searching(self, n_entries):
+        self.wait_label.setText(str(n_entries) + " entries collected.")
+
+    def _on_search_failed(self, error):
+        self.can_search = True
+        self.wait_label.hide()
+        showInfo(
+            "Search was interrupted (" + error + ").\n"
+            "Search again to resume from the last collected page."
+        )
 
     def _on_search_finished(self, entries):
         self.can_search = True
@@ -413,7 +744,8 @@ class JPDB_VocabListWidget(aqt.QWidget):
         self.query_results = entries
         self.query_results_list.addItems(entries)
 
-        self.save_urls(self.last_query, self.query_results)
+    def _on_search_report(self, entries):
+        instrumentation.show_report(self.search_worker.recording)
 
     def generate_or_update(self) -> None:
         if not self.can_generate:
@@ -427,7 +759,12 @@ class JPDB_VocabListWidget(aqt.QWidget):
         self.prog_bar.setValue(0)
 
         self.generation_worker = VLGenerationThread(
-            self.current_deck, self.query_results, self.sleep_time
+            self.current_deck,
+            self.query_results,
+            self.config,
+            vl_url=self.last_query,
+            sync=self.sync_checkBox.isChecked(),
+            remove=self.remove_checkBox.isChecked(),
         )
         self.generation_worker.generated.connect(self._on_generating)
         self.generation_worker.finished.connect(self._on_generation_finished)
@@ -438,10 +775,26 @@ class JPDB_VocabListWidget(aqt.QWidget):
         self.prog_bar.setValue(i)
 
     def _on_generation_finished(self):
+        self.can_search = True
         self.can_generate = True
         self.show_deck_widget()
         self.prog_bar.hide()
-        showInfo("Generation Finished!")
+
+        worker = self.generation_worker
+        if worker.error is not None:
+            message = worker.error + "\n"
+        else:
+            message = "Generation Finished!\n"
+        message += f"{worker.n_added} notes added."
+        if worker.n_failed > 0:
+            message += (
+                f"\n{worker.n_failed} entries could not be loaded and were "
+                "skipped, generate again to retry them."
+            )
+        if worker.remove:
+            message += f"\n{worker.n_removed} notes removed."
+        showInfo(message)
+        instrumentation.show_report(self.generation_worker.recording)
 
     def on_query_results_doubleClicked(self) -> None:
         url_index = self.query_results_list.currentIndex().row()
@@ -459,42 +812,34 @@ class JPDB_VocabListWidget(aqt.QWidget):
         self.deck_label.show()
         self.select_deck_comboBox.show()
 
-    def save_urls(self, vocab_list: str, urls: List[str]):
-        path = Path(__file__).parent.joinpath("vocab_lists")
-        os.makedirs(path, exist_ok=True)
-
-        with path.joinpath(self._get_key(vocab_list)).open("w") as f:
-            json.dump(urls, f)
-
-    def load_urls(self, vocab_list: str) -> List[str]:
-        path = Path(__file__).parent.joinpath("vocab_lists")
-        path = path.joinpath(self._get_key(vocab_list))
-
-        if not path.exists():
-            return []
-
-        with path.open("r") as f:
-            urls = json.load(f)
-        return urls
-
-    def _get_key(self, vocab_list: str) -> str:
-        return vocab_list.split("/")[-2]
-
 
 class RepositionWidget(aqt.QWidget):
-    def __init__(self, parent: aqt.QWidget):
+    def __init__(self, parent: aqt.QWidget, *, decks_list: Optional[List[str]] = None):
         super().__init__(parent)
 
         self.deck_label = aqt.QLabel("Select a deck", self)
         self.select_deck_comboBox = aqt.QComboBox(self)
         self.reposition_button = aqt.QPushButton("Reposition all notes", self)
+        self.incremental_checkBox = aqt.QCheckBox(
+            "Only update the cards whose position changed", self
+        )
+        self.incremental_checkBox.setChecked(True)
+
+        self.prog_bar = aqt.QProgressBar(self)
+        self.prog_bar.setRange(0, 4)
+        self.prog_bar.hide()
 
         self._layout = aqt.QFormLayout(self)
         self._layout.addWidget(self.deck_label)
         self._layout.addWidget(self.select_deck_comboBox)
+        self._layout.addWidget(self.incremental_checkBox)
         self._layout.addWidget(self.reposition_button)
+        self._layout.addWidget(self.prog_bar)
 
-        self.decks_list = KumaAnki.decks().all_names(force_default=False)
+        self.can_reposition = True
+        self.decks_list = (
+            decks_list if decks_list is not None else KumaAnki.deck_names()
+        )
         self.current_deck = self.decks_list[0]
         self.select_deck_comboBox.addItems(self.decks_list)
         self.select_deck_comboBox.currentIndexChanged.connect(self.on_deck_selected)
@@ -505,5 +850,35 @@ class RepositionWidget(aqt.QWidget):
         self.current_deck = self.select_deck_comboBox.currentText()
 
     def on_reposition_button_pressed(self):
-        reposition_on_frequency(self.current_deck)
-        showInfo("Repositioned!")
+        if not self.can_reposition:
+            return
+        self.can_reposition = False
+
+        self.prog_bar.setValue(0)
+        self.prog_bar.show()
+
+        deck_name = self.current_deck
+        incremental = self.incremental_checkBox.isChecked()
+
+        def on_progress(step: int):
+            aqt.mw.taskman.run_on_main(lambda: self.prog_bar.setValue(step))
+
+        # a collection op, so the write is undoable and the browser refreshed
+        CollectionOp(
+            parent=self,
+            op=lambda col: reposition_on_frequency(
+                deck_name, incremental=incremental, on_progress=on_progress
+            ),
+        ).success(self._on_reposition_finished).failure(
+            self._on_reposition_failed
+        ).run_in_background()
+
+    def _on_reposition_finished(self, changes):
+        self.can_reposition = True
+        self.prog_bar.hide()
+        showInfo(f"Repositioned! ({changes.count} new cards updated)")
+
+    def _on_reposition_failed(self, error: Exception):
+        self.can_reposition = True
+        self.prog_bar.hide()
+        showInfo(f"Reposition failed: {error}")
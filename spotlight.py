@@ -1,9 +1,9 @@
-from copy import copy
 from dataclasses import dataclass
-import requests
 
+from kuma import client
 from kuma.jpdb import JPDB_Note, get_pitch_html, PITCH_DICTIONARY
 from kuma.anki import KumaAnki
+from kuma.part_of_speech import beautify_partofspeech
 
 
 @dataclass
@@ -28,7 +28,7 @@ class JpdbAPI:
             "Accept": "application/json",
             "Authorization": f"Bearer {self.token}",
         }
-        response = requests.post(url, json=payload, headers=headers)
+        response = client.post(url, json=payload, headers=headers)
         notes = self.notes(response.json()["vocabulary"])
         return notes
 
@@ -51,143 +51,11 @@ class JpdbAPI:
             "Authorization": f"Bearer {self.token}",
         }
 
-        response = requests.post(url, json=payload, headers=headers)
+        response = client.post(url, json=payload, headers=headers)
         notes_info = response.json()["vocabulary_info"]
         return notes_info
 
 
-def beautify_partofspeech(pos, expression=None) -> str:
-    partofspeech_eq = {
-        "n": "Noun",
-        "pn": "Pronoun",
-        "prt": "Particle",
-        "int": "Interjection",
-        "conj": "Conjunction",
-        "pref": "Prefix",
-        "suf": "Suffix",
-        "cop": "Copula",
-        "ctr": "Counter",
-        "adj-i": "Adjective (い)",
-        "adj-no": "Adjective (の)",
-        "adj-na": "Adjective (な)",
-        "adj-ku": "Adjective (く)",
-        "adj-nari": "Adjective (なり)",
-        "adj-pn": "Pre-noun adjective",
-        "adv": "Adverb",
-        "exp": "Expression",
-        "aux": "Auxiliary",
-        "name": "Name",
-        "name-surname": "",
-        "name-place": "",
-        "name-male": "",
-        "name-fem": "",
-        "name-given": "",
-        "num": "Numeric",
-        "aux-adj": "Aux. adjective",
-        "aux-v": "Auxiliary Verb",
-        "vs": "Verb (する)",
-        "vi": "intransitive",
-        "vt": "transitive",
-        "va": "Verb archaic",
-        "v1": "1-dan",
-        "v1-s": "1-dan",
-        "v2": "2-dan",
-        "vk": "irregular",
-        "vs-c": "Verb (す)",
-        "v4": {
-            "": "",
-            "v4u": "4-dan, う",
-            "v4u-s": "4-dan, う",
-            "v4k": "4-dan, く",
-            "v4k-s": "4-dan, く",
-            "v4g": "4-dan, ぐ",
-            "v4g-s": "4-dan, ぐ",
-            "v4s": "4-dan, す",
-            "v4s-s": "4-dan, す",
-            "v4t": "4-dan, つ",
-            "v4t-s": "4-dan, つ",
-            "v4n": "4-dan, ぬ",
-            "v4n-s": "4-dan, ぬ",
-            "v4b": "4-dan, ぶ",
-            "v4b-s": "4-dan, ぶ",
-            "v4m": "4-dan, む",
-            "v4m-s": "4-dan, む",
-            "v4r": "4-dan, る",
-            "v4r-s": "4-dan, る",
-            "v4r-i": "irregular",
-            "v4aru": "4-dan",
-        },
-        "v5": {
-            "": "",
-            "v5u": "5-dan, う",
-            "v5u-s": "5-dan, う",
-            "v5k": "5-dan, く",
-            "v5k-s": "5-dan, く",
-            "v5g": "5-dan, ぐ",
-            "v5g-s": "5-dan, ぐ",
-            "v5s": "5-dan, す",
-            "v5s-s": "5-dan, す",
-            "v5t": "5-dan, つ",
-            "v5t-s": "5-dan, つ",
-            "v5n": "5-dan, ぬ",
-            "v5n-s": "5-dan, ぬ",
-            "v5b": "5-dan, ぶ",
-            "v5b-s": "5-dan, ぶ",
-            "v5m": "5-dan, む",
-            "v5m-s": "5-dan, む",
-            "v5r": "5-dan, る",
-            "v5r-s": "5-dan, る",
-            "v5r-i": "irregular",
-            "v5aru": "5-dan",
-        },
-    }
-
-    result = ""
-    t_or_i = ", "
-
-    def add_pos(res, pos):
-        if len(res) > 0:
-            res += ", "
-        res += pos
-        return res
-
-    _pos = copy(pos)
-    while len(_pos) > 0:
-        p = _pos.pop(0)
-
-        if p in ["vi", "vt"]:
-            t_or_i += partofspeech_eq[p]
-            continue
-
-        if p == "v4" or p == "v5":
-            _p = _pos.pop(0)
-            try:
-                result = add_pos(result, f"Verb ({partofspeech_eq[p][_p]}{t_or_i})")
-            except KeyError:
-                print(
-                    f"part of speech {_p} is not implemented, please fill an issue on GitHub."
-                )
-            continue
-
-        if p == "v1" or p == "v2":
-            add_pos(result, f"Verb ({partofspeech_eq[p]}{t_or_i})")
-            continue
-
-        if p == "vk":
-            result = add_pos(result, f"Verb ({partofspeech_eq['vk']}{t_or_i})")
-            continue
-
-        try:
-            result = add_pos(result, partofspeech_eq[p])
-        except:
-            print(
-                f"part of speech {p} is not implemented, please fill an issue on GitHub."
-            )
-            continue
-
-    return result
-
-
 def beautify_meaning(meaning) -> str:
     result = ""
     for i, m in enumerate(meaning):
@@ -198,7 +66,7 @@ def beautify_meaning(meaning) -> str:
 def to_jpdb_note(note: Note):
     return JPDB_Note(
         expression=note.spelling,
-        part_of_speech=beautify_partofspeech(note.part_of_speech, note.spelling),
+        part_of_speech=beautify_partofspeech(note.part_of_speech),
         spelling=note.reading,
         pitch=get_pitch_html(note.spelling, note.reading, PITCH_DICTIONARY),
         frequency=str(note.frequency_rank),